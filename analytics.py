@@ -0,0 +1,177 @@
+"""跨组排行榜: 并行解析日志目录, 按真实玩家汇总胜负、角色、投票和存活
+
+    python analytics.py [--log-dir ./logs] [--workers N] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from archive import get_archive, read_game, record_stats
+from groups import resolve_group
+from roster import get_roster
+
+GROUP_LOG_PATTERN = re.compile(
+    r'output_\d+_\d+_Group(\w+)\.(?:txt|ndjson)$')
+
+
+def _analyze(
+    args: Tuple[str, List[str]]
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """解析一个日志 (可以在进程池中运行), 返回 (统计, 归档记录);
+    游戏尚未结束时没有归档记录"""
+    log_file, names = args
+    record = read_game(log_file, unfinished=True)
+    stats = record_stats(record, log_file, names)
+    return stats, record if stats["finished"] else None
+
+
+def analyze_log(log_file: str, names: List[str]) -> Dict[str, Any]:
+    """统计一局游戏中每个玩家的角色、胜负、投票数和是否存活
+
+    投票以玩家的 RESPONSE 为准, 同一决定的日志行不重复计算 (见 archive.read_game).
+    """
+    return _analyze((log_file, names))[0]
+
+
+def aggregate(games: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按真实玩家汇总所有对局, 按胜场和胜率排序"""
+    stats = {}
+    for game in games:
+        for player in game["players"]:
+            entry = stats.setdefault(
+                player["name"], {
+                    "name": player["name"],
+                    "games": 0,
+                    "wins": 0,
+                    "losses": 0,
+                    "roles": {},
+                    "votes": 0,
+                    "survived": 0
+                })
+            entry["games"] += 1
+            entry["wins"] += player["win"]
+            entry["losses"] += player["loss"]
+            entry["roles"][player["role"]] = entry["roles"].get(
+                player["role"], 0) + 1
+            entry["votes"] += player["votes"]
+            entry["survived"] += bool(player["survived"])
+
+    for entry in stats.values():
+        decided = entry["wins"] + entry["losses"]
+        entry["win_rate"] = entry["wins"] / decided if decided else 0.0
+    return sorted(stats.values(),
+                  key=lambda x: (-x["wins"], -x["win_rate"], x["name"]))
+
+
+class Leaderboard:
+    """缓存每个日志文件的统计结果, 刷新时只重新解析大小或修改时间变化的文件
+
+    已归档的游戏直接从归档读取统计. 新解析出已结束的游戏会被归档, 写入的是
+    解析时得到的记录, 不再重新解析.
+    """
+
+    def __init__(self, log_dir: str = './logs', workers: Optional[int] = None):
+        self.log_dir = log_dir
+        self.workers = workers
+        self.games: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self.lock = Lock()  # 用于线程安全
+
+    def _group_logs(self) -> Dict[str, Tuple[Tuple[int, int], List[str]]]:
+        """日志目录中有真实名字对应的组日志: {路径: ((大小, 修改时间), 名字列表)}"""
+        logs = {}
+        if not os.path.isdir(self.log_dir):
+            return logs
+        groups = get_roster().groups()
+        for entry in os.scandir(self.log_dir):
+            match = GROUP_LOG_PATTERN.search(entry.name)
+            if not match or not entry.is_file():
+                continue
+            names = groups.get(resolve_group(match.group(1)))
+            if names is not None:
+                st = entry.stat()
+                logs[entry.path] = ((st.st_size, st.st_mtime_ns), names)
+        return logs
+
+    def refresh(self) -> int:
+        """重新统计有变化的日志, 返回有变化的文件数"""
+        records = []
+        with self.lock:
+            logs = self._group_logs()
+            changed = [(path, names)
+                       for path, (version, names) in logs.items()
+                       if self.games.get(path, (None, ))[0] != version]
+            for path in list(self.games):
+                if path not in logs:
+                    del self.games[path]
+            if not changed:
+                return 0
+
+            archive = get_archive()
+            parse = []
+            for path, names in changed:
+                result = archive.game_stats(path, names)
+                if result is None:
+                    parse.append((path, names))
+                else:
+                    self.games[path] = (logs[path][0], result)
+            if len(parse) == 1:
+                results = [_analyze(parse[0])]
+            elif parse:
+                # 只有多个日志需要解析时才导入 multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(self.workers) as pool:
+                    results = list(pool.map(_analyze, parse))
+            else:
+                results = []
+            for (path, _), (result, record) in zip(parse, results):
+                self.games[path] = (logs[path][0], result)
+                if record is not None:
+                    records.append(record)
+        # 写入归档不需要持有排行榜的锁
+        for record in records:
+            try:
+                archive.store(record)
+            except Exception as e:  # 归档失败不影响排行榜
+                print(f"Failed to archive {record['log_file']}: {e}")
+        return len(changed)
+
+    def result(self) -> Dict[str, Any]:
+        """刷新后返回排行榜和每局的统计"""
+        self.refresh()
+        with self.lock:
+            games = [game for _, game in self.games.values()]
+        games.sort(key=lambda x: x["log_file"])
+        return {"players": aggregate(games), "games": games}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--log-dir', default='./logs')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+
+    result = Leaderboard(args.log_dir, args.workers).result()
+    if args.json:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return 0
+
+    print(f"{'player':<20}{'games':>6}{'wins':>6}{'losses':>8}{'rate':>7}"
+          f"{'votes':>7}{'alive':>7}  roles")
+    for entry in result["players"]:
+        roles = ', '.join(f'{role}x{count}'
+                          for role, count in sorted(entry["roles"].items()))
+        print(f"{entry['name']:<20}{entry['games']:>6}{entry['wins']:>6}"
+              f"{entry['losses']:>8}{entry['win_rate']:>7.2f}"
+              f"{entry['votes']:>7}{entry['survived']:>7}  {roles}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,528 @@
+"""已结束游戏的 SQLite 归档
+
+日志出现 "Game over!" 后游戏内容不再变化, 解析结果 (玩家、分类后的对话、
+轮次索引) 存入本地 SQLite 数据库, 之后 /api/game-data 和排行榜直接查询归档,
+不再重新解析日志. 归档记录日志的大小和修改时间, 日志被覆盖后自动失效.
+归档只是日志的派生数据, 随时可以从原始日志重建::
+
+    python archive.py rebuild [--log-dir ./logs] [--db archive.sqlite3]
+    python archive.py list [--db archive.sqlite3]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from threading import Lock, local
+from typing import Any, Dict, List, Optional
+
+from parse import LogParser, _name_substitution, replace_player_names
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_FILE = os.environ.get('ARCHIVE_FILE',
+                              os.path.join(ROOT, 'archive.sqlite3'))
+# 表结构或记录的计算方式变化时加一, 旧版本的归档会被清空后重建
+SCHEMA_VERSION = 3
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    log_file TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    n_rounds INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    result TEXT,
+    game_over INTEGER,
+    messages INTEGER NOT NULL,
+    archived_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS players (
+    game_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    role TEXT NOT NULL,
+    avatar TEXT,
+    win INTEGER NOT NULL,
+    loss INTEGER NOT NULL,
+    votes INTEGER NOT NULL,
+    survived INTEGER,
+    PRIMARY KEY (game_id, id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    game_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    timestamp TEXT,
+    speaker TEXT NOT NULL,
+    role TEXT NOT NULL,
+    type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    player_name TEXT,
+    living_players TEXT,
+    UNIQUE (game_id, seq)
+);
+CREATE INDEX IF NOT EXISTS messages_round ON messages (game_id, round, phase);
+CREATE INDEX IF NOT EXISTS messages_speaker ON messages (speaker, game_id);
+CREATE INDEX IF NOT EXISTS messages_type ON messages (type, game_id);
+CREATE TABLE IF NOT EXISTS phases (
+    game_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    "end" INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    deaths TEXT NOT NULL,
+    PRIMARY KEY (game_id, start)
+);
+CREATE TABLE IF NOT EXISTS events (
+    game_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    player TEXT,
+    target TEXT
+);
+CREATE INDEX IF NOT EXISTS events_game ON events (game_id, seq);
+CREATE INDEX IF NOT EXISTS events_type ON events (type, round);
+"""
+# 对话内容的全文索引 (倒排索引), 内容本身仍然只存在 messages 表中
+# (messages.id 是显式的主键, VACUUM 不会改变它);
+# SQLite 没有编译 FTS5 时归档照常工作, 只是不能搜索
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id',
+    tokenize='unicode61'
+);
+"""
+TABLES = ('games', 'players', 'messages', 'phases', 'events')
+VOTE_KEYWORD = 'vote to eliminate'
+
+
+def _key(log_file: str) -> str:
+    """归档中日志文件的标识, 相对路径和绝对路径指向同一条记录"""
+    return os.path.realpath(log_file)
+
+
+def read_game(log_file: str,
+              unfinished: bool = False) -> Optional[Dict[str, Any]]:
+    """完整解析一局已结束的游戏, 返回要写入归档的记录; 游戏尚未结束时返回 None
+
+    记录只包含基本类型, 可以在进程池中生成后交给主进程写入. unfinished 为
+    True 时尚未结束的游戏也返回记录 (result 为 None), 只用于统计, 不能写入归档.
+    """
+    st = os.stat(log_file)
+    parser = LogParser(log_file)
+    events = list(parser.iter_events(final=True))
+    if parser.scanner.result is None and not unfinished:
+        return None
+    timeline = parser.timeline
+    timeline.feed(events, 0)
+    total = len(events)
+    index = timeline.to_dict(total)
+
+    votes = {}
+    living = None
+    living_seq = -1  # 最后一个 LIVING_PLAYERS 名单所在的消息
+    messages = []
+    phases = iter(index["phases"])
+    current = next(phases)
+    for seq, event in enumerate(events):
+        while seq >= current["end"]:
+            current = next(phases)
+        if event.living_players is not None:
+            living = event.living_players
+            living_seq = seq
+        # 与 analytics 相同, 投票以玩家的 RESPONSE 为准
+        if event.type == "Response" and VOTE_KEYWORD in event.content:
+            votes[event.speaker] = votes.get(event.speaker, 0) + 1
+        messages.append(
+            (seq, current["round"], current["phase"], event.timestamp,
+             event.speaker, event.role, event.type, event.content,
+             event.player_name,
+             json.dumps(event.living_players, ensure_ascii=False)
+             if event.living_players is not None else None))
+
+    if living is not None:
+        # 名单只出现在玩家的 JSON 块中, 最后一个块之后宣布的击杀和放逐
+        # (常见于 "Game over!" 之前) 不在其中
+        living = set(living) - {
+            event["player"] for event in index["events"]
+            if event["type"] in ("kill", "elimination")
+            and event["index"] > living_seq
+        }
+
+    summary = parser.collect([], parser.scanner)
+    players = [(player["id"], player["name"], player["role"],
+                player.get("avatar"), player.get("win", 0),
+                player.get("loss", 0), votes.get(player["name"], 0),
+                None if living is None else int(player["name"] in living))
+               for player in summary["players"]]
+    return {
+        "log_file": _key(log_file),
+        "version": (st.st_size, st.st_mtime_ns),
+        "n_rounds": summary["n_rounds"],
+        "rounds": index["rounds"],
+        "result": (parser.scanner.result[1].strip()
+                   if parser.scanner.result is not None else None),
+        "game_over": index["game_over"],
+        "players": players,
+        "messages": messages,
+        "phases": [(phase["start"], phase["end"], phase["round"],
+                    phase["phase"], json.dumps(phase["deaths"]))
+                   for phase in index["phases"]],
+        "events": [(event["index"], event["type"], event["round"],
+                    event["phase"], event.get("player"), event.get("target"))
+                   for event in index["events"]]
+    }
+
+
+def _player_stats(rows, names: List[str]) -> List[Dict[str, Any]]:
+    """players 表的行 (id, name, role, avatar, win, loss, votes, survived)
+    转换为 analytics.analyze_log 格式的玩家统计, 不包括主持人"""
+    players = []
+    for id, name, role, _, win, loss, votes, survived in rows:
+        if id <= 0:
+            continue
+        index = id - 1
+        players.append({
+            "name": names[index] if 0 <= index < len(names) else name,
+            "role": role,
+            "win": win,
+            "loss": loss,
+            "votes": votes,
+            "survived": None if survived is None else bool(survived)
+        })
+    return players
+
+
+def record_stats(record: Dict[str, Any], log_file: str,
+                 names: List[str]) -> Dict[str, Any]:
+    """read_game() 记录中的统计, 与 analytics.analyze_log 格式相同"""
+    return {
+        "log_file": log_file,
+        "finished": record["result"] is not None,
+        "players": _player_stats(record["players"], names)
+    }
+
+
+class GameArchive:
+    """已结束游戏的归档, 每个线程使用自己的数据库连接, 写入串行进行"""
+
+    def __init__(self, path: str = ARCHIVE_FILE):
+        self.path = path
+        self.local = local()
+        self.lock = Lock()  # 用于线程安全
+        self.archiving = set()  # 正在归档的日志, 避免重复解析
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != \
+                    SCHEMA_VERSION:
+                with self.lock, conn:
+                    for table in ('messages_fts', ) + TABLES:
+                        conn.execute(f'DROP TABLE IF EXISTS {table}')
+                    conn.executescript(SCHEMA)
+                    try:
+                        conn.executescript(FTS_SCHEMA)
+                    except sqlite3.OperationalError as e:
+                        print(f"Full-text search disabled: {e}")
+                    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.local.conn = conn
+        return conn
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """在当前线程的连接上执行只读查询"""
+        return self._connection().execute(sql, params)
+
+    def has_fts(self) -> bool:
+        """是否有全文索引"""
+        return self._connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone() is not None
+
+    def _game(self, log_file: str) -> Optional[sqlite3.Row]:
+        """日志对应的归档记录, 没有归档或日志在归档后发生变化时返回 None"""
+        row = self._connection().execute(
+            'SELECT * FROM games WHERE log_file = ?',
+            (_key(log_file), )).fetchone()
+        if row is None:
+            return None
+        try:
+            st = os.stat(log_file)
+        except FileNotFoundError:
+            return row  # 原始日志已删除, 归档仍然可用
+        if (st.st_size, st.st_mtime_ns) != (row["size"], row["mtime_ns"]):
+            return None
+        return row
+
+    def has(self, log_file: str) -> bool:
+        return self._game(log_file) is not None
+
+    def store(self, record: Dict[str, Any]) -> None:
+        """写入 read_game() 的结果, 替换同一日志的旧归档"""
+        conn = self._connection()
+        fts = self.has_fts()
+        with self.lock, conn:
+            old = conn.execute('SELECT id FROM games WHERE log_file = ?',
+                               (record["log_file"], )).fetchone()
+            if old is not None:
+                if fts:
+                    conn.execute(
+                        "INSERT INTO messages_fts (messages_fts, rowid, "
+                        "content) SELECT 'delete', id, content "
+                        "FROM messages WHERE game_id = ?", (old["id"], ))
+                for table in TABLES[1:]:
+                    conn.execute(f'DELETE FROM {table} WHERE game_id = ?',
+                                 (old["id"], ))
+                conn.execute('DELETE FROM games WHERE id = ?', (old["id"], ))
+            game_id = conn.execute(
+                'INSERT INTO games (log_file, size, mtime_ns, n_rounds, '
+                'rounds, result, game_over, messages, archived_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (record["log_file"], *record["version"], record["n_rounds"],
+                 record["rounds"], record["result"], record["game_over"],
+                 len(record["messages"]), time.time())).lastrowid
+            conn.executemany(
+                'INSERT INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(game_id, *row) for row in record["players"]])
+            conn.executemany(
+                'INSERT INTO messages (game_id, seq, round, phase, timestamp, '
+                'speaker, role, type, content, player_name, living_players) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(game_id, *row) for row in record["messages"]])
+            conn.executemany('INSERT INTO phases VALUES (?, ?, ?, ?, ?, ?)',
+                             [(game_id, *row) for row in record["phases"]])
+            conn.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             [(game_id, *row) for row in record["events"]])
+            # 每归档一局游戏就把它的对话加入全文索引
+            if fts:
+                conn.execute(
+                    'INSERT INTO messages_fts (rowid, content) '
+                    'SELECT id, content FROM messages WHERE game_id = ?',
+                    (game_id, ))
+
+    def archive(self, log_file: str) -> bool:
+        """归档一局已结束的游戏, 返回归档中是否有该游戏的最新内容"""
+        key = _key(log_file)
+        with self.lock:
+            if key in self.archiving:
+                return False
+            self.archiving.add(key)
+        try:
+            if self.has(log_file):
+                return True
+            record = read_game(log_file)
+            if record is None:
+                return False
+            self.store(record)
+            return True
+        finally:
+            with self.lock:
+                self.archiving.discard(key)
+
+    def game_data(self,
+                  log_file: str,
+                  names: Optional[List[str]] = None,
+                  round: Optional[int] = None,
+                  phase: Optional[str] = None,
+                  offset: int = 0,
+                  limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """与 LogParser.parse 格式相同的结果, 没有有效的归档时返回 None"""
+        game = self._game(log_file)
+        if game is None:
+            return None
+        conn = self._connection()
+        game_id = game["id"]
+        total = game["messages"]
+        start, end = 0, total
+        if round is not None:
+            row = conn.execute(
+                'SELECT MIN(start), MAX("end") FROM phases '
+                'WHERE game_id = ? AND round = ? AND (? IS NULL OR phase = ?)',
+                (game_id, round, phase, phase)).fetchone()
+            start, end = row if row[0] is not None else (0, 0)
+        start = min(start + offset, end)
+        if limit is not None:
+            end = min(end, start + limit)
+
+        players = []
+        for row in conn.execute(
+                'SELECT * FROM players WHERE game_id = ? ORDER BY id = 0, id',
+                (game_id, )):
+            if row["role"] == "Moderator":
+                players.append({"id": 0, "name": "Moderator",
+                                "role": "Moderator"})
+            else:
+                players.append({
+                    "id": row["id"],
+                    "name": row["name"],
+                    "role": row["role"],
+                    "avatar": row["avatar"],
+                    "win": row["win"],
+                    "loss": row["loss"]
+                })
+        dialogue = []
+        for row in conn.execute(
+                'SELECT speaker, content, type, role, player_name, '
+                'living_players FROM messages '
+                'WHERE game_id = ? AND seq >= ? AND seq < ? ORDER BY seq',
+                (game_id, start, end)):
+            message = {
+                "speaker": row[0],
+                "content": row[1],
+                "type": row[2],
+                "role": row[3]
+            }
+            if row[5] is not None:
+                message["player_name"] = row[4]
+                message["living_players"] = json.loads(row[5])
+            dialogue.append(message)
+
+        mapping = _name_substitution(tuple(names))[0] if names else {}
+        phases = [{
+            "round": row["round"],
+            "phase": row["phase"],
+            "start": row["start"],
+            "deaths": [mapping.get(p, p) for p in json.loads(row["deaths"])],
+            "end": row["end"]
+        } for row in conn.execute(
+            'SELECT * FROM phases WHERE game_id = ? ORDER BY start',
+            (game_id, ))]
+        events = []
+        for row in conn.execute(
+                'SELECT * FROM events WHERE game_id = ? AND seq >= ? '
+                'AND seq < ? ORDER BY rowid', (game_id, start, end)):
+            event = {
+                "type": row["type"],
+                "round": row["round"],
+                "phase": row["phase"],
+                "index": row["seq"]
+            }
+            for key in ("player", "target"):
+                if row[key] is not None:
+                    event[key] = mapping.get(row[key], row[key])
+            events.append(event)
+        if names:
+            replace_player_names(names, players, dialogue)
+
+        return {
+            "players": players,
+            "dialogue": dialogue,
+            "n_rounds": game["n_rounds"],
+            "current_round": game["rounds"],
+            "game_over": True,
+            "timeline": {
+                "rounds": game["rounds"],
+                "phases": phases,
+                "events": events,
+                "game_over": game["game_over"]
+            },
+            "window": {"start": start, "end": end, "total": total}
+        }
+
+    def timestamps(self, log_file: str) -> Optional[List[Optional[str]]]:
+        """每条对话的时间戳, 没有有效的归档时返回 None"""
+        game = self._game(log_file)
+        if game is None:
+            return None
+        return [
+            row[0] for row in self._connection().execute(
+                'SELECT timestamp FROM messages WHERE game_id = ? '
+                'ORDER BY seq', (game["id"], ))
+        ]
+
+    def game_stats(self, log_file: str,
+                   names: List[str]) -> Optional[Dict[str, Any]]:
+        """与 analytics.analyze_log 格式相同的统计, 没有有效的归档时返回 None"""
+        game = self._game(log_file)
+        if game is None:
+            return None
+        rows = self._connection().execute(
+            'SELECT id, name, role, avatar, win, loss, votes, survived '
+            'FROM players WHERE game_id = ? ORDER BY id', (game["id"], ))
+        return {
+            "log_file": log_file,
+            "finished": True,
+            "players": _player_stats(rows, names)
+        }
+
+    def games(self) -> List[Dict[str, Any]]:
+        """所有归档的游戏"""
+        return [
+            dict(row) for row in self._connection().execute(
+                'SELECT id, log_file, n_rounds, rounds, result, messages, '
+                'archived_at FROM games ORDER BY log_file')
+        ]
+
+    def rebuild(self, log_dir: str, workers: Optional[int] = None) -> int:
+        """清空归档, 从日志目录中重新归档所有已结束的游戏, 返回归档的游戏数"""
+        files = sorted(entry.path for entry in os.scandir(log_dir)
+                       if entry.is_file() and entry.name.startswith('output_'))
+        conn = self._connection()
+        with self.lock, conn:
+            for table in TABLES:
+                conn.execute(f'DELETE FROM {table}')
+            if self.has_fts():
+                conn.execute("INSERT INTO messages_fts (messages_fts) "
+                             "VALUES ('delete-all')")
+        # 进程池只在重建时需要, 不在服务器启动时导入 multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        count = 0
+        with ProcessPoolExecutor(workers) as pool:
+            for record in pool.map(read_game, files):
+                if record is not None:
+                    self.store(record)
+                    count += 1
+        conn.execute('VACUUM')
+        return count
+
+
+_archive = None
+_archive_lock = Lock()
+
+
+def get_archive() -> GameArchive:
+    """进程内共享的归档, 设置了 ARCHIVE_FILE 时使用该数据库文件"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = GameArchive()
+        return _archive
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=ARCHIVE_FILE, help='归档数据库文件')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help='从原始日志重建归档')
+    rebuild.add_argument('--log-dir', default='./logs')
+    rebuild.add_argument('--workers', type=int, default=None)
+    commands.add_parser('list', help='列出已归档的游戏')
+    args = parser.parse_args()
+
+    archive = GameArchive(args.db)
+    if args.command == 'rebuild':
+        start = time.perf_counter()
+        count = archive.rebuild(args.log_dir, args.workers)
+        print(f"archived {count} games from {args.log_dir} "
+              f"in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    for game in archive.games():
+        print(f"{game['id']:>5}  {game['rounds']:>3} rounds  "
+              f"{game['messages']:>6} messages  {game['log_file']}  "
+              f"{game['result']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,593 @@
+"""解析器性能测试
+
+对抗性输入 (未闭合的字符串、缺少 RESPONSE 的块、没有分隔符的日志行等)
+在不同规模下的解析时间, 时间随输入规模近似线性增长才算通过.
+
+    python bench.py adversarial [--size 200000] [--legacy]
+
+用确定性的合成日志测试各解析阶段和 /api/game-data 的耗时、吞吐量和峰值内存.
+
+    python bench.py generate out.txt [--players 11] [--rounds 6] ...
+    python bench.py suite [--rounds 25,50,100,200] [--repeat 3] [--json]
+
+解析器常驻内存 (已提交的消息和轮次索引) 平均每条消息的字节数, 不指定日志时
+使用合成日志及其 NDJSON 版本.
+
+    python bench.py memory [logs...] [--rounds 200]
+
+归档统计的正确性检查 (例如最后一个 JSON 块之后宣布的死亡不算存活).
+
+    python bench.py check
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import parse
+from classifier import get_classifier
+from convert_log import convert
+from parse import LogParser, parse_log_file
+from roster import get_roster
+
+TIMESTAMP = '2024-11-17 08:35:44.896'
+
+# 旧版解析器使用的正则, 仅用于对比
+LEGACY_JSON_PATTERN = re.compile(
+    r'{\s*"ROLE":[^{]*?"RESPONSE":\s*"[^"]*"[^}]*?}', re.DOTALL)
+LEGACY_MESSAGE_PATTERN = re.compile(
+    r'(?:(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) \| (?:INFO|ERROR|WARNING).*? - )?(Player\d+|Moderator)\((\w+)\):\s*(.*?)(?=(?:\n\d{4}-\d{2}-\d{2}|\n(?:Player\d+|Moderator)\(|\n{|$))',
+    re.DOTALL)
+
+
+def _repeat(unit: str, size: int) -> str:
+    return unit * max(1, size // len(unit))
+
+
+ADVERSARIAL_CASES: Dict[str, Callable[[int], str]] = {
+    # 字符串一直没有闭合
+    "unclosed_quote":
+    lambda n: '{\n    "ROLE": "Seer",\n    "THOUGHTS": "' + 'a' * n,
+    # 每行一个未闭合的字符串
+    "unclosed_quote_lines":
+    lambda n: '{\n' + _repeat('    "THOUGHTS": "abc\n', n),
+    # 反复出现 RESPONSE 但没有 '}'
+    "missing_close_brace":
+    lambda n: '{ "ROLE": "Seer", ' + _repeat('"RESPONSE": "x", ', n),
+    # 只有 THOUGHTS 没有 RESPONSE 的块
+    "missing_response":
+    lambda n: _repeat('{\n    "ROLE": "Seer",\n    "THOUGHTS": "x"\n}\n', n),
+    # 没有 ' - ' 分隔符的日志行
+    "log_lines_without_separator":
+    lambda n: _repeat(f'{TIMESTAMP} | INFO     | x\n', n),
+    # 块内大量穿插的日志行
+    "interleaved_log_lines":
+    lambda n: '{\n    "ROLE": "Seer",\n' + _repeat(
+        f'{TIMESTAMP} | INFO     | x:y:1 - Player1(Seer): Verify Player2\n',
+        n) + '    "RESPONSE": "x"\n}\n',
+    # 深层嵌套的括号
+    "deep_nesting":
+    lambda n: '{"ROLE": ' + '{' * (n // 2) + '}' * (n // 2) + '}\n',
+    # 大量反斜杠
+    "backslashes":
+    lambda n: '{\n    "ROLE": "Seer",\n    "THOUGHTS": "' + '\\' * n,
+    # 一行中反复出现发言前缀
+    "speaker_prefixes":
+    lambda n: _repeat('Player1(', n),
+}
+
+
+def _time(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _time_parse(content: str) -> float:
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False,
+                                     encoding='utf-8') as f:
+        f.write(content)
+    try:
+        return _time(lambda: parse_log_file(f.name))
+    finally:
+        os.unlink(f.name)
+
+
+def _time_legacy(content: str) -> float:
+    return _time(lambda: (list(LEGACY_JSON_PATTERN.finditer(content)),
+                          list(LEGACY_MESSAGE_PATTERN.finditer(content))))
+
+
+def run_adversarial(size: int, legacy: bool = False) -> bool:
+    """规模每翻一倍时间也只应大约翻一倍, 8 倍规模超过 16 倍时间视为退化"""
+    ok = True
+    scales = [1, 2, 4, 8]
+    print(f"{'case':<30}" + ''.join(f'{s * size:>12}' for s in scales) +
+          f"{'ratio':>8}")
+    for name, build in ADVERSARIAL_CASES.items():
+        timer = _time_legacy if legacy else _time_parse
+        times = [timer(build(scale * size)) for scale in scales]
+        ratio = times[-1] / max(times[0], 1e-6)
+        slow = ratio > 16
+        ok = ok and not slow
+        print(f'{name:<30}' + ''.join(f'{t * 1000:>10.1f}ms' for t in times) +
+              f'{ratio:>8.1f}' + ('  SLOW' if slow else ''))
+    return ok
+
+
+# 各角色夜间行动的问句和动作
+NIGHT_ACTIONS = {
+    "Werewolf": ("kill", "Hunt"),
+    "Guard": ("protect", "Protect"),
+    "Seer": ("verify", "Verify"),
+    "Witch": ("poison", "Poison"),
+}
+START_TIME = datetime(2024, 11, 17, 8, 35, 44)
+NOISE_LINES = [
+    'INFO     | metagpt.utils.cost_manager:update_cost:57 - Total running cost: $0.012 | Max budget: $50.000',
+    'ERROR    | metagpt.utils.common:wrapper:649 - Exception occurs, start to handle it',
+    'WARNING  | metagpt.provider.openai_api:_achat_completion:82 - Retrying request',
+]
+MALFORMED_BLOCKS = [
+    # 字符串没有闭合
+    '{{\n    "ROLE": "{role}",\n    "THOUGHTS": "{text}\n',
+    # 缺少 RESPONSE
+    '{{\n    "ROLE": "{role}",\n    "PLAYER_NAME": "{player}",\n    "THOUGHTS": "{text}"\n}}\n',
+    # 缺少右括号
+    '{{\n    "ROLE": "{role}",\n    "RESPONSE": "{text}",\n',
+]
+SENTENCES = [
+    "{p} has been very quiet, which makes me suspicious.",
+    "I trust {p} because their vote matched mine yesterday.",
+    "If {p} is the Seer, we should protect them tonight.",
+    "The werewolves probably targeted {p} for a reason.",
+    "Let us focus on {p} and listen to their defence.",
+]
+
+
+def generate_log(players: int = 11,
+                 rounds: int = 6,
+                 seed: int = 0,
+                 verbosity: int = 2,
+                 json_density: float = 1.0,
+                 noise: float = 0.2,
+                 malformed: float = 0.02) -> str:
+    """生成 MetaGPT 狼人杀格式的日志, 相同参数总是得到相同的内容
+
+    ``verbosity`` 是每段思考和发言的句子数, ``json_density`` 是玩家行动
+    带 THOUGHTS/RESPONSE 块的比例, ``noise`` 是穿插 INFO/ERROR 日志行的
+    概率, ``malformed`` 是插入损坏块的概率.
+    """
+    rnd = random.Random(seed)
+    n_werewolves = max(1, players // 4)
+    specials = ["Seer", "Witch", "Guard"][:max(0, players - n_werewolves - 1)]
+    roles = (["Werewolf"] * n_werewolves + specials +
+             ["Villager"] * (players - n_werewolves - len(specials)))
+    rnd.shuffle(roles)
+    names = [f"Player{i}" for i in range(1, players + 1)]
+    role_of = dict(zip(names, roles))
+    living = list(names)
+    clock = [START_TIME]
+    out = []
+
+    def log(level: str, location: str, text: str) -> str:
+        clock[0] += timedelta(milliseconds=rnd.randint(5, 3000))
+        ts = clock[0].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        return f"{ts} | {level:<8} | {location} - {text}"
+
+    def noise_line() -> str:
+        level, rest = rnd.choice(NOISE_LINES).split(' | ', 1)
+        location, text = rest.split(' - ', 1)
+        return log(level.strip(), location, text)
+
+    def emit(line: str) -> None:
+        out.append(line + "\n")
+        if rnd.random() < noise:
+            out.append(noise_line() + "\n")
+
+    def moderator(text: str) -> None:
+        emit(log("INFO", "metagpt.ext.werewolf.roles.moderator:_act:187",
+                 f"Moderator(Moderator): {text}"))
+
+    def text() -> str:
+        return " ".join(
+            rnd.choice(SENTENCES).format(p=rnd.choice(living))
+            for _ in range(verbosity))
+
+    def act(player: str, response: str) -> None:
+        role = role_of[player]
+        if rnd.random() < json_density:
+            block = json.dumps({
+                "ROLE": role,
+                "PLAYER_NAME": player,
+                "LIVING_PLAYERS": living,
+                "THOUGHTS": text(),
+                "RESPONSE": response
+            }, indent=4, ensure_ascii=False).split("\n")
+            if rnd.random() < noise:
+                block.insert(rnd.randint(1, len(block) - 1), noise_line())
+            out.append("\n".join(block) + "\n")
+        if rnd.random() < malformed:
+            out.append(rnd.choice(MALFORMED_BLOCKS).format(
+                role=role, player=player, text=text()))
+        emit(log("INFO", "metagpt.ext.werewolf.roles.base_player:_act:90",
+                 f"{player}({role}): {response}"))
+
+    out.append("Game setup:\n" + "".join(
+        f"{name}: {role_of[name]}," + "\n" for name in names))
+    for _ in range(rounds):
+        moderator("It’s dark, everyone close your eyes. "
+                  "I will talk with you/your team secretly at night.")
+        for role, (verb, action) in NIGHT_ACTIONS.items():
+            acting = [p for p in living if role_of[p] == role]
+            if not acting:
+                continue
+            moderator(f"{role}, please open your eyes! "
+                      f"Who would you like to {verb}?")
+            for player in acting:
+                act(player, f"{action} {rnd.choice(living)}")
+            moderator(f"{role}, please close your eyes. Understood?")
+
+        # 保留至少一半玩家, 长对局后面是平安夜
+        if len(living) > players // 2:
+            dead = rnd.choice(living)
+            living.remove(dead)
+            moderator(f"It's daylight. {dead} was killed last night!")
+        else:
+            moderator("It's daylight. It was a peaceful night.")
+
+        for player in living:
+            moderator(f"{player}, please speak.")
+            act(player, text())
+        moderator("Now vote and tell me who you think is the werewolf.")
+        for player in living:
+            act(player, f"I vote to eliminate {rnd.choice(living)}")
+        if len(living) > players // 2:
+            out_player = rnd.choice(living)
+            living.remove(out_player)
+            moderator(f"{out_player} was eliminated.")
+
+    winner = rnd.choice(["Good guys win", "Werewolves win"])
+    moderator(f"Game over! {winner}!")
+    return "".join(out)
+
+
+def check_survival() -> bool:
+    """最后一个 LIVING_PLAYERS 名单之后宣布的死亡不算存活
+
+    合成日志的一轮以放逐结束, 之后没有 JSON 块; 再在 "Game over!" 之前加入
+    一次击杀, 与实际日志中游戏结束前的夜晚相同.
+    """
+    from archive import read_game
+
+    content = generate_log(players=11, rounds=1, noise=0.0, malformed=0.0)
+    dead = set(re.findall(r'(Player\d+) (?:was killed|was eliminated)',
+                          content))
+    victim = next(f'Player{i}' for i in range(1, 12)
+                  if f'Player{i}' not in dead)
+    dead.add(victim)
+    content = re.sub(r'(?m)^(.*Moderator\(Moderator\): )Game over!',
+                     lambda match: f"{match.group(1)}It's daylight. {victim} "
+                     f"was killed last night!\n{match.group(0)}", content)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'output_1_11_check.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        record = read_game(path)
+    survivors = {name for id, name, *_, survived in record["players"]
+                 if id > 0 and survived}
+    ok = not survivors & dead and len(survivors) == 11 - len(dead)
+    print(f"survival after the last JSON block: dead {sorted(dead)}, "
+          f"{len(survivors)} survivors" + ('' if ok else '  FAIL'))
+    return ok
+
+
+def _best(func: Callable[[], Any], repeat: int) -> float:
+    return min(_time(func) for _ in range(repeat))
+
+
+def _names(players: int) -> List[str]:
+    names = get_roster().group_names('final')
+    return [names[i % len(names)] for i in range(players)]
+
+
+def profile_phases(path: str, players: int, repeat: int) -> Dict[str, float]:
+    """分别计时解析的各个阶段 (秒), 以及完整解析的峰值内存 (字节)
+
+    扫描阶段一次读取同时识别游戏设置、消息和游戏结果.
+    """
+    names = _names(players)
+    state = {}
+
+    def scan():
+        parser = LogParser(path)
+        state["parser"] = parser
+        state["messages"] = list(parser.iter_events(final=True))
+
+    def collect():
+        parser = state["parser"]
+        state["data"] = parser.collect(state["messages"], parser.scanner)
+
+    def replace_names():
+        data = state["data"]
+        players = [dict(player) for player in data["players"]]
+        dialogue = [dict(message) for message in data["dialogue"]]
+        state["parser"]._replace_player_names(names, players, dialogue)
+        state["named"] = dict(data, players=players, dialogue=dialogue)
+
+    def serialize():
+        json.dumps(state["named"], ensure_ascii=False)
+
+    result = {}
+    for phase in (scan, collect, replace_names, serialize):
+        result[phase.__name__] = _best(phase, repeat)
+    result["total"] = _best(lambda: json.dumps(parse_log_file(path, names),
+                                               ensure_ascii=False), repeat)
+
+    tracemalloc.start()
+    try:
+        parse_log_file(path, names)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result["messages"] = len(state["messages"])
+    return result
+
+
+def _load_app() -> Optional[Tuple[Any, Any]]:
+    """导入 src/server.py 中的应用和测试客户端, 缺少依赖 (fastapi, httpx)
+    时返回 None"""
+    try:
+        from fastapi.testclient import TestClient
+        from src import server
+    except ImportError as e:
+        print(f'跳过 /api/game-data: {e}', file=sys.stderr)
+        return None
+    return server, TestClient
+
+
+def profile_endpoint(app: Tuple[Any, Any], path: str,
+                     repeat: int) -> Dict[str, float]:
+    """通过测试客户端计时 /api/game-data: 冷启动、缓存命中和 304
+
+    使用临时目录中的归档, 并且不归档结束的游戏, 每次冷启动都从日志解析.
+    """
+    import archive
+
+    server, TestClient = app
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'logs'))
+        shutil.copy(path, os.path.join(root, 'logs', 'output_1_11_Group1.txt'))
+        os.chdir(root)
+        saved = archive._archive, server._archive_game
+        archive._archive = archive.GameArchive(
+            os.path.join(root, 'archive.sqlite3'))
+        server._archive_game = lambda log_file: None
+        try:
+            server.game_state.set(1, 11, '')
+            client = TestClient(server.app)
+
+            def cold():
+                server.game_data_cache.clear()
+                with parse._parsers_lock:
+                    parse._parsers.clear()
+                response = client.get('/api/game-data')
+                assert response.status_code == 200, response.status_code
+
+            result = {"cold": _best(cold, repeat)}
+            response = client.get('/api/game-data')
+            result["cached"] = _best(lambda: client.get('/api/game-data'),
+                                     repeat)
+            etag = response.headers['ETag']
+            result["not_modified"] = _best(
+                lambda: client.get('/api/game-data',
+                                   headers={'If-None-Match': etag}), repeat)
+            return result
+        finally:
+            archive._archive, server._archive_game = saved
+            os.chdir(cwd)
+
+
+def measure_memory(path: str) -> Dict[str, Any]:
+    """解析完整个日志后解析器常驻的内存, 以及其中消息内容字符串之外的部分"""
+    get_classifier()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        parser = LogParser(path)
+        parser.update()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    messages = max(len(parser.messages), 1)
+    content = sum(sys.getsizeof(message.content)
+                  for message in parser.messages)
+    return {
+        "log_file": path,
+        "format": parser.format,
+        "messages": len(parser.messages),
+        "bytes": used,
+        "bytes_per_message": used / messages,
+        "overhead_per_message": (used - content) / messages
+    }
+
+
+def run_memory(paths: List[str], rounds: int, players: int,
+               as_json: bool, **options) -> bool:
+    """各日志的解析器常驻内存"""
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        if not paths:
+            path = os.path.join(root, f'output_{rounds}_{players}_bench.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(generate_log(players=players, rounds=rounds, **options))
+            events_path = os.path.splitext(path)[0] + '.ndjson'
+            with open(events_path, 'w', encoding='utf-8') as f:
+                convert(path, f)
+            paths = [path, events_path]
+        for path in paths:
+            results.append(measure_memory(path))
+    if as_json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return True
+    print(f"{'log':<36}{'format':>8}{'msgs':>9}{'MB':>8}{'B/msg':>8}"
+          f"{'overhead':>10}")
+    for r in results:
+        print(f"{os.path.basename(r['log_file'])[:35]:<36}{r['format']:>8}"
+              f"{r['messages']:>9}{r['bytes'] / (1 << 20):>8.1f}"
+              f"{r['bytes_per_message']:>8.0f}"
+              f"{r['overhead_per_message']:>10.0f}")
+    return True
+
+
+def run_suite(rounds: List[int], players: int, repeat: int,
+              endpoint: bool, as_json: bool, **options) -> bool:
+    """不同规模的合成日志上的各阶段耗时、吞吐量和峰值内存
+
+    每 MB 耗时随规模增长超过 2 倍视为非线性退化.
+    """
+    results = []
+    app = _load_app() if endpoint else None
+    with tempfile.TemporaryDirectory() as root:
+        for n in rounds:
+            path = os.path.join(root, f'output_{n}_{players}_bench.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(generate_log(players=players, rounds=n, **options))
+            size = os.path.getsize(path)
+            result = {"rounds": n, "bytes": size}
+            result.update(profile_phases(path, players, repeat))
+            result["mb_per_s"] = size / (1 << 20) / max(result["total"], 1e-9)
+            if app is not None:
+                result["endpoint"] = profile_endpoint(app, path, repeat)
+            results.append(result)
+
+    per_mb = [r["total"] / r["bytes"] for r in results]
+    ok = per_mb[-1] <= 2 * per_mb[0]
+    classifier = get_classifier().stats()
+    if as_json:
+        json.dump({"results": results, "classifier": classifier, "ok": ok},
+                  sys.stdout, indent=2)
+        print()
+        return ok
+
+    phases = ["scan", "collect", "replace_names", "serialize", "total"]
+    print(f"{'rounds':>7}{'MB':>8}{'msgs':>8}" +
+          ''.join(f'{phase:>15}' for phase in phases) +
+          f"{'MB/s':>8}{'peak MB':>9}{'ms/MB':>8}")
+    for r, cost in zip(results, per_mb):
+        print(f"{r['rounds']:>7}{r['bytes'] / (1 << 20):>8.2f}"
+              f"{r['messages']:>8}" +
+              ''.join(f'{r[phase] * 1000:>13.1f}ms' for phase in phases) +
+              f"{r['mb_per_s']:>8.1f}{r['peak_memory'] / (1 << 20):>9.1f}"
+              f"{cost * (1 << 20) * 1000:>8.1f}")
+    if app is not None:
+        print(f"\n/api/game-data\n{'rounds':>7}{'cold':>12}{'cached':>12}"
+              f"{'304':>12}")
+        for r in results:
+            e = r["endpoint"]
+            print(f"{r['rounds']:>7}{e['cold'] * 1000:>10.1f}ms"
+                  f"{e['cached'] * 1000:>10.1f}ms"
+                  f"{e['not_modified'] * 1000:>10.1f}ms")
+    print(f"\nclassifier: {classifier['messages']} messages, "
+          f"{classifier['seconds'] / max(classifier['messages'], 1) * 1e6:.2f}"
+          f"us/message")
+    for rule in classifier["rules"]:
+        print(f"{rule['table']:>12} {rule['type']:<14}{rule['hits']:>10}"
+              f"{rule['seconds'] * 1000:>10.1f}ms"
+              f"{rule['seconds'] / max(rule['hits'], 1) * 1e6:>8.2f}us")
+    if not ok:
+        print('\nSLOW: 每 MB 耗时随规模增长超过 2 倍')
+    return ok
+
+
+def _add_generator_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--players', type=int, default=11)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbosity', type=int, default=2,
+                        help='每段思考和发言的句子数')
+    parser.add_argument('--json-density', type=float, default=1.0,
+                        help='带 THOUGHTS/RESPONSE 块的行动比例')
+    parser.add_argument('--noise', type=float, default=0.2,
+                        help='穿插 INFO/ERROR 日志行的概率')
+    parser.add_argument('--malformed', type=float, default=0.02,
+                        help='插入损坏块的概率')
+
+
+def _generator_options(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "seed": args.seed,
+        "verbosity": args.verbosity,
+        "json_density": args.json_density,
+        "noise": args.noise,
+        "malformed": args.malformed
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    adversarial = subparsers.add_parser('adversarial',
+                                        help='对抗性输入的线性度检查')
+    adversarial.add_argument('--size', type=int, default=200000)
+    adversarial.add_argument('--legacy', action='store_true',
+                             help='改为测试旧版正则 (用于对比)')
+    generate = subparsers.add_parser('generate', help='生成合成日志')
+    generate.add_argument('output')
+    generate.add_argument('--rounds', type=int, default=6)
+    _add_generator_options(generate)
+    suite = subparsers.add_parser('suite', help='各阶段和接口的耗时')
+    suite.add_argument('--rounds', default='25,50,100,200',
+                       help='逗号分隔的轮数, 每个轮数生成一个日志')
+    suite.add_argument('--repeat', type=int, default=3,
+                       help='每项重复次数, 取最快的一次')
+    suite.add_argument('--no-endpoint', action='store_true',
+                       help='不测试 /api/game-data')
+    suite.add_argument('--json', action='store_true', help='输出 JSON')
+    _add_generator_options(suite)
+    subparsers.add_parser('check', help='归档统计的正确性检查')
+    memory = subparsers.add_parser('memory', help='解析器每条消息的常驻内存')
+    memory.add_argument('logs', nargs='*', help='要测量的日志, 默认生成合成日志')
+    memory.add_argument('--rounds', type=int, default=200)
+    memory.add_argument('--json', action='store_true', help='输出 JSON')
+    _add_generator_options(memory)
+    args = parser.parse_args()
+
+    if args.command == 'adversarial':
+        return 0 if run_adversarial(args.size, args.legacy) else 1
+    if args.command == 'check':
+        return 0 if check_survival() else 1
+    if args.command == 'generate':
+        content = generate_log(players=args.players,
+                               rounds=args.rounds,
+                               **_generator_options(args))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return 0
+    if args.command == 'memory':
+        ok = run_memory(args.logs, args.rounds, args.players, args.json,
+                        **_generator_options(args))
+        return 0 if ok else 1
+    if args.command == 'suite':
+        rounds = [int(n) for n in args.rounds.split(',')]
+        ok = run_suite(rounds, args.players, args.repeat,
+                       not args.no_endpoint, args.json,
+                       **_generator_options(args))
+        return 0 if ok else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
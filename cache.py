@@ -0,0 +1,65 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    etag: str  # 强 ETag, 由响应内容的哈希得到 (不含引号)
+    body: bytes
+    encoding: Optional[str] = None  # Content-Encoding, 未压缩时为 None
+
+
+class ResponseCache:
+    """已序列化响应的 LRU 缓存, 同时限制条目数和总字节数"""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0  # 当前缓存的总字节数
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()  # 用于线程安全
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """查找缓存, 命中时移动到最近使用的位置"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key: Hashable) -> Optional[CachedResponse]:
+        """查找缓存但不计入命中和未命中, 也不改变淘汰顺序"""
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self,
+            key: Hashable,
+            body: bytes,
+            encoding: Optional[str] = None) -> CachedResponse:
+        """缓存响应内容并返回带 ETag 的条目, 超出限制时淘汰最久未使用的条目"""
+        entry = CachedResponse(hashlib.sha1(body).hexdigest(), body, encoding)
+        if len(body) > self.max_bytes:
+            return entry
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self.entries[key] = entry
+            self.size += len(body)
+            while (len(self.entries) > self.max_entries
+                   or self.size > self.max_bytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+        return entry
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
@@ -0,0 +1,161 @@
+import json
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from message import Message
+
+# 按发言者 (主持人名字) 或角色查找规则表, 都没有时使用 "*";
+# 表内规则按顺序匹配, 第一个命中关键词的规则决定类型, 都不命中时使用 default
+DEFAULT_RULES: Dict[str, Dict[str, Any]] = {
+    "Moderator": {
+        "rules": [
+            {"type": "Question", "keywords": ["choose", "who", "would you like"],
+             "ignore_case": True},
+            {"type": "Confirmation", "keywords": ["understood"],
+             "ignore_case": True},
+            {"type": "Announcement",
+             "keywords": ["killed", "eliminated", "game over"],
+             "ignore_case": True},
+        ],
+        "default": "Instruction"
+    },
+    "*": {
+        "rules": [
+            {"type": "Preparation", "keywords": ["ready to"]},
+            {"type": "Action",
+             "keywords": ["vote to eliminate", "Hunt", "Protect", "Verify",
+                          "Poison", "Save", "Pass"]},
+        ],
+        "default": "Say"
+    }
+}
+# JSON 格式的规则文件, 结构与 DEFAULT_RULES 相同
+RULES_FILE = os.environ.get('MESSAGE_RULES_FILE')
+
+
+class RuleTable:
+    """编译后的一张规则表
+
+    关键词预先按是否忽略大小写转换好, 每条消息最多转换一次小写, 之后只做
+    子串查找 (实测 CPython 的 re 组合交替正则比逐个子串查找更慢).
+    """
+
+    def __init__(self, name: str, table: Dict[str, Any]):
+        self.name = name
+        self.types = [rule["type"] for rule in table["rules"]]
+        self.default = table["default"]
+        self.rules = [
+            (bool(rule.get("ignore_case")),
+             tuple(keyword.lower() if rule.get("ignore_case") else keyword
+                   for keyword in rule["keywords"]))
+            for rule in table["rules"]
+        ]
+        self.ignore_case = any(ignore_case for ignore_case, _ in self.rules)
+        self.labels = self.types + [self.default]  # 按 match() 的返回值取类型
+        self.hits = [0] * (len(self.types) + 1)  # 最后一项是 default
+        # 由每条规则决定类型的消息的累计分类耗时 (秒), 包括之前未命中的规则
+        self.seconds = [0.0] * (len(self.types) + 1)
+
+    def match(self, content: str) -> int:
+        """第一条命中的规则序号, 都不命中时返回规则数 (即 default)"""
+        lowered = content.lower() if self.ignore_case else content
+        for index, (ignore_case, keywords) in enumerate(self.rules):
+            text = lowered if ignore_case else content
+            for keyword in keywords:
+                if keyword in text:
+                    return index
+        return len(self.rules)
+
+
+class MessageClassifier:
+    """表驱动的消息分类器, 统计每条规则的命中次数和分类耗时
+
+    每条消息的耗时计入决定其类型的规则 (都不命中时计入 default), 包括检查
+    之前未命中的规则的时间; 相邻两条消息共用一次计时, 每条消息只读一次时钟.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.tables = {
+            name: RuleTable(name, table)
+            for name, table in (rules or DEFAULT_RULES).items()
+        }
+        self.messages = 0
+        self.seconds = 0.0
+        self.lock = Lock()  # 用于线程安全
+
+    def _table(self, speaker: str, role: str) -> RuleTable:
+        return (self.tables.get(speaker) or self.tables.get(role)
+                or self.tables["*"])
+
+    def classify_batch(self, messages: List[Message]) -> None:
+        """批量判断消息类型, 直接写入每条消息的 type 属性"""
+        if not messages:
+            return
+        tables = self.tables
+        default_table = tables["*"]
+        clock = time.perf_counter
+        # 每批只加锁一次
+        with self.lock:
+            start = last = clock()
+            for message in messages:
+                table = (tables.get(message.speaker)
+                         or tables.get(message.role) or default_table)
+                index = table.match(message.content)
+                message.type = table.labels[index]
+                table.hits[index] += 1
+                now = clock()
+                table.seconds[index] += now - last
+                last = now
+            self.messages += len(messages)
+            self.seconds += last - start
+
+    def classify(self, speaker: str, content: str, role: str) -> str:
+        """判断单条消息的类型"""
+        message = Message(None, 0, speaker, content, None, role)
+        self.classify_batch([message])
+        return message.type
+
+    def stats(self) -> Dict[str, Any]:
+        """每条规则的命中次数和耗时, 以及总的分类耗时"""
+        with self.lock:
+            rules = []
+            for table in self.tables.values():
+                for index, hits in enumerate(table.hits):
+                    is_default = index == len(table.types)
+                    rules.append({
+                        "table": table.name,
+                        "type": table.labels[index],
+                        "default": is_default,
+                        "hits": hits,
+                        "seconds": table.seconds[index]
+                    })
+            return {
+                "messages": self.messages,
+                "seconds": self.seconds,
+                "rules": rules
+            }
+
+
+def load_rules(path: str) -> Dict[str, Dict[str, Any]]:
+    """从 JSON 文件读取规则表"""
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    if "*" not in rules:
+        raise ValueError(f"{path}: missing default rule table '*'")
+    return rules
+
+
+_classifier = None
+_classifier_lock = Lock()
+
+
+def get_classifier() -> MessageClassifier:
+    """进程内共享的分类器, 设置了 MESSAGE_RULES_FILE 时从该文件读取规则"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = MessageClassifier(
+                load_rules(RULES_FILE) if RULES_FILE else None)
+        return _classifier
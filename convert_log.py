@@ -0,0 +1,71 @@
+"""把 MetaGPT 的文本日志转换为 NDJSON 事件流, 用于迁移以前的游戏
+
+    python convert_log.py logs/output_1_11_Group1.txt [...] [--out-dir DIR]
+
+输出文件与原日志同名, 扩展名为 .ndjson; LogParser 会自动识别这种格式,
+解析结果与原日志相同.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import IO, Dict, Optional
+
+from message import Message
+from parse import LogParser
+
+
+def _event(message: Message) -> Dict:
+    event = {
+        "timestamp": message.timestamp,
+        "speaker": message.speaker,
+        "role": message.role,
+        "type": message.type,
+        "content": message.content
+    }
+    if message.living_players is not None:
+        event["player_name"] = message.player_name
+        event["living_players"] = message.to_dict()["living_players"]
+    return event
+
+
+def convert(log_file: str, out: IO[str]) -> int:
+    """把一个文本日志写成事件流, 返回写入的消息数"""
+    parser = LogParser(log_file)
+    messages = list(parser.iter_events(final=True))
+    players = parser.scanner.players
+    if players:
+        out.write(json.dumps({
+            "players": [{"id": p["id"], "role": p["role"]} for p in players]
+        }, ensure_ascii=False) + '\n')
+    for message in messages:
+        out.write(json.dumps(_event(message), ensure_ascii=False) + '\n')
+    return len(messages)
+
+
+def output_path(log_file: str, out_dir: Optional[str] = None) -> str:
+    """转换后的文件路径: 同名的 .ndjson 文件"""
+    name = os.path.splitext(os.path.basename(log_file))[0] + '.ndjson'
+    return os.path.join(out_dir or os.path.dirname(log_file), name)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--out-dir', default=None)
+    args = parser.parse_args()
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    for log_file in args.logs:
+        path = output_path(log_file, args.out_dir)
+        tmp_file = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as out:
+            count = convert(log_file, out)
+        os.replace(tmp_file, path)
+        print(f"{log_file} -> {path} ({count} messages)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
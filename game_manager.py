@@ -0,0 +1,163 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import deque
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional
+
+from parse import get_parser, release_parser
+
+START_GAME_SCRIPT = '../MetaGPT/examples/werewolf_game/start_game.py'
+# 最多保留的已结束游戏数, 超过后最早结束的游戏不再可以查询 (日志文件保留)
+MAX_FINISHED_GAMES = 100
+
+
+def game_command(script: str, n_round: int, n_player: int) -> List[str]:
+    """启动一局游戏的命令行"""
+    return [sys.executable, script, str(n_round), str(n_player), '50']
+
+
+class Game:
+    """一局由 GameManager 启动的游戏"""
+
+    def __init__(self, game_id: str, n_round: int, n_player: int,
+                 log_file: str, command: List[str]):
+        self.id = game_id
+        self.n_round = n_round
+        self.n_player = n_player
+        self.log_file = log_file
+        self.command = command
+        self.status = 'queued'  # queued / running / finished / failed
+        self.returncode = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.progress = None  # 结束时的最终解析进度
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "game_id": self.id,
+            "n_round": self.n_round,
+            "n_player": self.n_player,
+            "log_file": self.log_file,
+            "status": self.status,
+            "returncode": self.returncode,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class GameManager:
+    """并发运行多局游戏, 超过并发上限的游戏排队等待
+
+    每局游戏是一个独立的子进程, 输出直接重定向到自己的日志文件, 由后台线程
+    等待进程结束并启动队列中的下一局, 不会阻塞请求线程. 只有正在运行的游戏
+    保留解析器, 结束时记录最终进度后释放; 已结束的游戏最多保留
+    max_finished 局.
+    """
+
+    def __init__(self,
+                 log_dir: str = './logs',
+                 max_running: int = 2,
+                 script: str = START_GAME_SCRIPT,
+                 max_finished: int = MAX_FINISHED_GAMES):
+        self.log_dir = log_dir
+        self.max_running = max_running
+        self.script = script
+        self.max_finished = max_finished
+        self.games: Dict[str, Game] = {}
+        self.finished = deque()  # 按结束顺序排列的已结束游戏 id
+        self.queue = deque()
+        self.running = 0
+        self.lock = Lock()  # 用于线程安全
+
+    def submit(self, n_round: int, n_player: int) -> Game:
+        """创建一局游戏, 有空闲名额时立即启动, 否则排队"""
+        game_id = uuid.uuid4().hex[:8]
+        log_file = os.path.join(self.log_dir,
+                                f'output_{n_round}_{n_player}_{game_id}.log')
+        command = game_command(self.script, n_round, n_player)
+        game = Game(game_id, n_round, n_player, log_file, command)
+        with self.lock:
+            self.games[game_id] = game
+            self.queue.append(game)
+        self._start_queued()
+        return game
+
+    def get(self, game_id: str) -> Optional[Game]:
+        with self.lock:
+            return self.games.get(game_id)
+
+    def list(self) -> List[Game]:
+        with self.lock:
+            return list(self.games.values())
+
+    def status(self, game: Game) -> Dict[str, Any]:
+        """游戏状态, 包含从日志解析出的进度"""
+        data = game.to_dict()
+        data["queue_position"] = None
+        with self.lock:
+            if game.status == 'queued' and game in self.queue:
+                data["queue_position"] = self.queue.index(game)
+        if game.status == 'running':
+            data["progress"] = get_parser(game.log_file).progress()
+            # 期间游戏已经结束并释放了解析器时, 不重新保留它
+            if game.status != 'running':
+                release_parser(game.log_file)
+        elif game.status != 'queued':
+            data["progress"] = game.progress
+        return data
+
+    def _start_queued(self) -> None:
+        """在并发上限内启动排队中的游戏"""
+        while True:
+            with self.lock:
+                if self.running >= self.max_running or not self.queue:
+                    return
+                game = self.queue.popleft()
+                self.running += 1
+                game.status = 'running'
+                game.started_at = time.time()
+
+            try:
+                os.makedirs(self.log_dir, exist_ok=True)
+                with open(game.log_file, 'wb') as log:
+                    game.process = subprocess.Popen(game.command,
+                                                    stdout=log,
+                                                    stderr=subprocess.STDOUT,
+                                                    stdin=subprocess.DEVNULL)
+            except OSError as e:
+                game.error = str(e)
+                self._finish(game, None)
+                continue
+
+            Thread(target=self._wait, args=(game, ), daemon=True).start()
+
+    def _wait(self, game: Game) -> None:
+        """等待子进程结束"""
+        self._finish(game, game.process.wait())
+
+    def _finish(self, game: Game, returncode: Optional[int]) -> None:
+        """记录游戏结束和最终进度, 释放解析器并启动下一局"""
+        try:
+            progress = get_parser(game.log_file).progress()
+        except OSError:  # 进程没有启动时可能没有日志
+            progress = None
+        with self.lock:
+            game.returncode = returncode
+            game.status = 'finished' if returncode == 0 else 'failed'
+            game.finished_at = time.time()
+            game.progress = progress
+            self.running -= 1
+            self.finished.append(game.id)
+            while len(self.finished) > self.max_finished:
+                self.games.pop(self.finished.popleft(), None)
+        # 状态改变之后再释放, status() 不会在释放后重新保留解析器
+        release_parser(game.log_file)
+        self._start_queued()
@@ -0,0 +1,24 @@
+import os
+from typing import Union
+
+# 组 id: 数字组号或 'final'; 每组的玩家名单在 groups.json 中配置, 由 roster.py 读取
+GroupId = Union[int, str]
+
+
+def resolve_group(value: Union[int, str]) -> GroupId:
+    """把组号转换为组 id, 7 (或 'final') 表示决赛, 其他非数字的组 id 原样返回"""
+    if str(value) in ('7', 'final'):
+        return 'final'
+    try:
+        return int(value)
+    except ValueError:
+        return str(value)
+
+
+def group_log_file(group_id: GroupId) -> str:
+    """组对应的日志文件路径, 只有转换后的 NDJSON 事件流时使用它"""
+    log_file = f'./logs/output_1_11_Group{group_id}.txt'
+    events_file = f'./logs/output_1_11_Group{group_id}.ndjson'
+    if not os.path.exists(log_file) and os.path.exists(events_file):
+        return events_file
+    return log_file
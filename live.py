@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+from parse import get_parser
+
+# 每个客户端最多积压的消息数, 超过后丢弃积压并让客户端重新同步
+CLIENT_QUEUE_SIZE = 64
+# 轮询日志文件的间隔 (秒), 不依赖 inotify
+POLL_INTERVAL = 0.5
+
+# 队列中的重新同步标记: 客户端应当丢弃已有内容并重新获取快照
+RESYNC = None
+
+
+class Subscriber:
+    """一个已连接的客户端, 拥有自己的有界发送队列"""
+
+    def __init__(self, watcher: 'LogWatcher'):
+        self.watcher = watcher
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.resyncing = False  # 队列中有重新同步标记, 之后的消息已包含在快照中
+        self.dropped = 0  # 因积压而触发重新同步的次数
+
+    def push(self, message: str) -> None:
+        """放入一条已序列化的消息; 队列已满时清空积压, 改为发送重新同步标记"""
+        if self.resyncing:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.resyncing = True
+            self.dropped += 1
+
+    async def next_message(self) -> str:
+        """等待下一条要发送的消息, 重新同步时返回当前的完整快照"""
+        message = await self.queue.get()
+        if message is RESYNC:
+            self.resyncing = False
+            return self.watcher.snapshot()
+        return message
+
+
+class LogWatcher:
+    """轮询一个日志文件, 每个文件只解析一次, 把新增的对话推送给所有订阅者
+
+    维护一份已提交对话的副本用于给新连接的客户端发送快照; 每次变化只序列化
+    一次, 同一条消息字符串放入所有订阅者的队列. 解析器每次都从 get_parser
+    取得, 不自己保留: 归档后 release_parser 释放的解析器不会在这里多存一份.
+    """
+
+    def __init__(self, log_file: str, names: Optional[List[str]] = None,
+                 interval: float = POLL_INTERVAL):
+        self.log_file = log_file
+        self.names = names
+        self.interval = interval
+        self.version = None  # 上次解析时日志文件的 (大小, 修改时间)
+        self.subscribers: Set[Subscriber] = set()
+        self.cursor = None
+        self.state = {
+            "players": [],
+            "dialogue": [],
+            "pending": [],
+            "n_rounds": 0,
+            "current_round": 0,
+            "game_over": False,
+            "timeline": {"rounds": 0, "phases": [], "events": [],
+                         "game_over": None}
+        }
+        self.task = None
+
+    def snapshot(self) -> str:
+        """当前完整状态的快照消息"""
+        return json.dumps(dict(self.state, type="snapshot"),
+                          ensure_ascii=False)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self)
+        self.subscribers.add(subscriber)
+        subscriber.push(self.snapshot())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+
+    def publish(self, message: str) -> None:
+        for subscriber in list(self.subscribers):
+            subscriber.push(message)
+
+    async def poll(self) -> Optional[str]:
+        """解析新追加的内容 (在线程中进行, 不阻塞事件循环), 返回要推送的消息
+
+        日志文件没有变化时不解析, 也就不会重新创建已经释放的解析器.
+        """
+        try:
+            st = os.stat(self.log_file)
+            version = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            version = None
+        if version is not None and version == self.version:
+            return None
+        parser = get_parser(self.log_file)
+        delta = await asyncio.to_thread(parser.parse_since, self.cursor,
+                                        self.names)
+        self.version = version
+        return self.apply(delta)
+
+    def apply(self, delta: Dict) -> Optional[str]:
+        """把增量合并到当前状态, 返回要推送的消息, 没有变化时返回 None"""
+        self.cursor = delta["cursor"]
+        if delta["reset"]:
+            self.state = {
+                key: delta[key]
+                for key in ("players", "dialogue", "pending", "n_rounds",
+                            "current_round", "game_over", "timeline")
+            }
+            return self.snapshot()
+        if (not delta["dialogue"] and "players" not in delta
+                and delta["pending"] == self.state["pending"]):
+            return None
+
+        # 增量中的事件从游标处开始, 之前尾部消息的事件被替换
+        start = len(self.state["dialogue"])
+        timeline = self.state["timeline"]
+        self.state["timeline"] = dict(
+            delta["timeline"],
+            events=[event for event in timeline["events"]
+                    if event["index"] < start] + delta["timeline"]["events"])
+        self.state["dialogue"].extend(delta["dialogue"])
+        self.state["pending"] = delta["pending"]
+        self.state["current_round"] = delta["current_round"]
+        self.state["game_over"] = delta["game_over"]
+        message = {
+            "type": "append",
+            "dialogue": delta["dialogue"],
+            "pending": delta["pending"],
+            "current_round": delta["current_round"],
+            "game_over": delta["game_over"]
+        }
+        if (delta["timeline"]["events"]
+                or delta["timeline"]["phases"] != timeline["phases"]):
+            message["timeline"] = delta["timeline"]
+        if "players" in delta:
+            self.state["players"] = message["players"] = delta["players"]
+        return json.dumps(message, ensure_ascii=False)
+
+    async def run(self) -> None:
+        """后台轮询日志文件
+
+        解析或读取出错时记录错误、通知订阅者并继续轮询; 恢复后发送完整快照,
+        订阅者丢弃出错前的内容重新同步.
+        """
+        failed = False
+        while True:
+            try:
+                message = await self.poll()
+            except Exception as e:
+                if not failed:
+                    print(f"Failed to poll {self.log_file}: {e}")
+                    self.publish(json.dumps({"type": "error",
+                                             "error": str(e)}))
+                    failed = True
+                # 下一次轮询不带游标, 返回完整的快照
+                self.cursor = None
+                self.version = None
+            else:
+                if failed:
+                    print(f"Resumed polling {self.log_file}")
+                    failed = False
+                if message is not None:
+                    self.publish(message)
+            await asyncio.sleep(self.interval)
+
+
+class LiveHub:
+    """管理所有正在被观看的日志文件, 有订阅者时才启动对应的 LogWatcher"""
+
+    def __init__(self):
+        self.watchers: Dict[str, LogWatcher] = {}
+
+    def subscribe(self, log_file: str,
+                  names: Optional[List[str]] = None) -> Subscriber:
+        """订阅日志文件的推送, 需要在事件循环中调用"""
+        watcher = self.watchers.get(log_file)
+        if watcher is None:
+            watcher = self.watchers[log_file] = LogWatcher(log_file, names)
+            watcher.task = asyncio.create_task(watcher.run())
+        return watcher.subscribe()
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        watcher = subscriber.watcher
+        watcher.unsubscribe(subscriber)
+        if not watcher.subscribers and self.watchers.get(
+                watcher.log_file) is watcher:
+            watcher.task.cancel()
+            del self.watchers[watcher.log_file]
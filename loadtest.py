@@ -0,0 +1,544 @@
+"""服务器负载测试: 本地游戏进程加上模拟的观众
+
+用 stub_game.py 按指定速率把一局游戏写入某一组的日志, 同时模拟大量观众:
+轮询观众像 ApiHandler.js 一样每秒请求一次 /api/game-data (带 ETag 重新验证和
+gzip), WebSocket 观众保持 /ws 连接接收推送. 游戏进行过程中定期输出请求的
+p50/p95/p99 延迟、吞吐量、错误率, 以及服务器进程的 CPU 和 RSS (读取 /proc,
+仅 Linux), 结束时输出整场的汇总.
+
+``--serve`` 在临时目录中启动服务器 (日志和归档都写在临时目录里, 不影响 ./logs);
+否则测试 ``--url`` 指定的服务器, 游戏日志写入 ``--log-dir`` (服务器的 ./logs),
+``--server-pid`` 指定要监控的服务器进程.
+
+    python loadtest.py --serve --pollers 300 --websockets 100 [--rate 20]
+    python loadtest.py --url http://127.0.0.1:8080 --log-dir ./logs --group 9 \\
+        --server-pid 1234 --pollers 500 --overwrite
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from groups import resolve_group
+from roster import get_roster
+
+try:
+    import websockets
+except ImportError:  # 只有 --websockets 需要
+    websockets = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(ROOT, 'src', 'server.py')
+STUB_GAME_SCRIPT = os.path.join(ROOT, 'stub_game.py')
+# 和浏览器一样请求压缩的响应
+ACCEPT_ENCODING = 'gzip, deflate, br'
+SERVER_START_TIMEOUT = 30.0
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩百分位数, 没有数据时返回 None"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1,
+                             math.ceil(p / 100 * len(values)) - 1))]
+
+
+class Stats:
+    """请求延迟和错误计数, 分为当前报告区间和整场两部分"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.total_latencies: List[float] = []
+        self.statuses: Dict[int, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.requests = self.total_requests = 0
+        self.failures = self.total_failures = 0
+        self.bytes = 0
+        self.ws_open = 0
+        self.ws_connects: List[float] = []
+        self.ws_messages = self.total_ws_messages = 0
+        self.first = None  # 第一个请求的延迟, 反映冷启动
+
+    def request(self, latency: float, status: int, size: int) -> None:
+        if self.first is None:
+            self.first = latency
+        self.latencies.append(latency)
+        self.requests += 1
+        self.bytes += size
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400:
+            self.failures += 1
+
+    def error(self, kind: str) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def interval(self, seconds: float) -> Dict[str, Any]:
+        """当前区间的统计, 并开始新的区间"""
+        latencies = self.latencies
+        result = {
+            "requests": self.requests,
+            "rps": self.requests / seconds if seconds > 0 else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "error_rate": (self.failures / self.requests
+                           if self.requests else 0.0),
+            "ws_open": self.ws_open,
+            "ws_messages": self.ws_messages
+        }
+        self.total_latencies += latencies
+        self.total_requests += self.requests
+        self.total_failures += self.failures
+        self.total_ws_messages += self.ws_messages
+        self.latencies = []
+        self.requests = self.failures = self.ws_messages = 0
+        return result
+
+
+class ProcessMonitor:
+    """从 /proc 读取进程的 CPU 使用率和 RSS"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.last = None
+        self.cpu_samples: List[float] = []
+        self.max_rss = 0
+
+    def _read(self) -> Tuple[float, float, int]:
+        with open(f'/proc/{self.pid}/stat') as f:
+            # 进程名可能包含空格, 从最后一个 ')' 之后开始按空格分割
+            fields = f.read().rpartition(')')[2].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self.ticks
+        rss = int(fields[21]) * self.page_size
+        return time.monotonic(), cpu, rss
+
+    def sample(self) -> Optional[Dict[str, float]]:
+        """上次采样以来的 CPU 使用率 (%) 和当前 RSS (MB), 进程不存在时返回 None"""
+        try:
+            now, cpu, rss = self._read()
+        except (OSError, IndexError, ValueError):
+            return None
+        result = {"rss_mb": rss / (1 << 20), "cpu": None}
+        if self.last is not None and now > self.last[0]:
+            result["cpu"] = (cpu - self.last[1]) / (now - self.last[0]) * 100
+            self.cpu_samples.append(result["cpu"])
+        self.last = (now, cpu)
+        self.max_rss = max(self.max_rss, rss)
+        return result
+
+
+class HttpConnection:
+    """最简单的 HTTP/1.1 keep-alive 客户端连接, 每个观众一个, 和浏览器一样复用连接"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def get(self, path: str,
+                  headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """发送 GET 请求; 复用的连接已被服务器关闭时重新连接一次"""
+        reused = self.writer is not None
+        try:
+            return await self._get(path, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+        return await self._get(path, headers)
+
+    async def _get(self, path: str,
+                   headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        request = (f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n' +
+                   ''.join(f'{name}: {value}\r\n'
+                           for name, value in headers.items()) + '\r\n')
+        self.writer.write(request.encode('latin-1'))
+        try:
+            status_line = await self.reader.readline()
+            if not status_line:
+                raise ConnectionError('connection closed')
+            status = int(status_line.split()[1])
+            response_headers = {}
+            while True:
+                line = await self.reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+            if 'chunked' in response_headers.get('transfer-encoding', ''):
+                body = await self._read_chunked()
+            else:
+                body = await self.reader.readexactly(
+                    int(response_headers.get('content-length', 0)))
+        except BaseException:
+            self.close()
+            raise
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, body
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+
+async def poller(host: str, port: int, path: str, interval: float,
+                 timeout: float, stats: Stats, stop: asyncio.Event) -> None:
+    """一个轮询观众: 每 interval 秒请求一次, 带上次的 ETag"""
+    connection = HttpConnection(host, port)
+    etag = None
+    # 观众不是同时打开页面的, 第一次请求随机错开
+    next_time = time.monotonic() + random.uniform(0, interval)
+    try:
+        while not stop.is_set():
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            # 和 setInterval 一样按固定节奏, 响应慢时不补发
+            next_time = max(next_time + interval, time.monotonic())
+            headers = {"Accept-Encoding": ACCEPT_ENCODING}
+            if etag:
+                headers["If-None-Match"] = etag
+            start = time.perf_counter()
+            try:
+                status, response_headers, body = await asyncio.wait_for(
+                    connection.get(path, headers), timeout)
+            except asyncio.TimeoutError:
+                connection.close()
+                stats.error('timeout')
+                continue
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                stats.error(type(e).__name__)
+                continue
+            stats.request(time.perf_counter() - start, status, len(body))
+            etag = response_headers.get('etag', etag)
+    finally:
+        connection.close()
+
+
+async def ws_client(url: str, stats: Stats, stop: asyncio.Event) -> None:
+    """一个 WebSocket 观众: 保持连接并接收推送, 断开后一秒重连"""
+    await asyncio.sleep(random.uniform(0, 1))
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            async with websockets.connect(url, max_size=None) as websocket:
+                stats.ws_connects.append(time.perf_counter() - start)
+                stats.ws_open += 1
+                try:
+                    while not stop.is_set():
+                        receive = asyncio.ensure_future(websocket.recv())
+                        stopped = asyncio.ensure_future(stop.wait())
+                        done, _ = await asyncio.wait(
+                            (receive, stopped),
+                            return_when=asyncio.FIRST_COMPLETED)
+                        if receive not in done:
+                            receive.cancel()
+                            return
+                        stopped.cancel()
+                        receive.result()
+                        stats.ws_messages += 1
+                finally:
+                    stats.ws_open -= 1
+        except Exception as e:
+            stats.errors[f'ws_{type(e).__name__}'] = stats.errors.get(
+                f'ws_{type(e).__name__}', 0) + 1
+            try:
+                await asyncio.wait_for(stop.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start_server(port: int, workdir: str) -> subprocess.Popen:
+    """在 workdir 中启动服务器, 服务器的 ./logs 和归档都在该目录下"""
+    env = dict(os.environ,
+               PORT=str(port),
+               ARCHIVE_FILE=os.path.join(workdir, 'archive.sqlite3'))
+    with open(os.path.join(workdir, 'server.log'), 'wb') as log:
+        return subprocess.Popen([sys.executable, SERVER_SCRIPT],
+                                cwd=workdir,
+                                env=env,
+                                stdout=log,
+                                stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL)
+
+
+async def wait_ready(host: str, port: int,
+                     process: Optional[subprocess.Popen]) -> float:
+    """等待服务器可以响应请求, 返回等待的时间"""
+    start = time.monotonic()
+    while time.monotonic() - start < SERVER_START_TIMEOUT:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        connection = HttpConnection(host, port)
+        try:
+            await connection.get('/metrics', {})
+            return time.monotonic() - start
+        except (OSError, asyncio.IncompleteReadError):
+            await asyncio.sleep(0.1)
+        finally:
+            connection.close()
+    raise RuntimeError('server did not start')
+
+
+def start_game(log_file: str, n_round: int, n_player: int, rate: float,
+               seed: int) -> subprocess.Popen:
+    """启动本地游戏进程, 按速率写入日志"""
+    with open(log_file, 'wb') as log:
+        return subprocess.Popen([
+            sys.executable, STUB_GAME_SCRIPT,
+            str(n_round),
+            str(n_player), '50', '--rate',
+            str(rate)
+        ],
+                                stdout=log,
+                                stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL,
+                                env=dict(os.environ,
+                                         WEREWOLF_SEED=str(seed)))
+
+
+def _ms(value: Optional[float]) -> str:
+    return '-' if value is None else f'{value * 1000:.1f}ms'
+
+
+def _format_interval(elapsed: float, interval: Dict[str, Any]) -> str:
+    line = (f"t={elapsed:6.1f}s  {interval['rps']:7.1f} req/s  "
+            f"p50 {_ms(interval['p50'])}  p95 {_ms(interval['p95'])}  "
+            f"p99 {_ms(interval['p99'])}  "
+            f"errors {interval['error_rate'] * 100:.1f}%  "
+            f"ws {interval['ws_open']} open {interval['ws_messages']} msgs")
+    server = interval.get("server")
+    if server:
+        cpu = server["cpu"]
+        line += (f"  cpu {'-' if cpu is None else f'{cpu:.0f}%'}"
+                 f"  rss {server['rss_mb']:.0f}MB")
+    if interval.get("log_bytes") is not None:
+        line += f"  log {interval['log_bytes'] / 1024:.0f}KB"
+    return line
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    group_id = resolve_group(args.group)
+    names = get_roster().group_names(group_id)
+    if names is None:
+        raise SystemExit(f'Unknown group: {args.group}')
+
+    workdir = server = None
+    if args.serve:
+        workdir = tempfile.mkdtemp(prefix='werewolf-loadtest-')
+        host, port = '127.0.0.1', args.port
+        log_dir = os.path.join(workdir, 'logs')
+        os.makedirs(log_dir)
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+        log_dir = args.log_dir
+    log_file = os.path.join(log_dir, f'output_1_11_Group{group_id}.txt')
+
+    game = None
+    try:
+        if not args.no_game:
+            if (not args.serve and not args.overwrite and
+                    os.path.exists(log_file) and os.path.getsize(log_file)):
+                raise SystemExit(f'{log_file} exists, use --overwrite')
+            # 先写入空日志, 服务器启动时组日志已经存在
+            open(log_file, 'wb').close()
+        if args.serve:
+            server = start_server(port, workdir)
+        startup = await wait_ready(host, port, server)
+        pid = server.pid if server is not None else args.server_pid
+        monitor = ProcessMonitor(pid) if pid else None
+        if monitor:
+            monitor.sample()
+        if not args.no_game:
+            game = start_game(log_file, args.rounds, len(names), args.rate,
+                              args.seed)
+
+        stats = Stats()
+        stop = asyncio.Event()
+        path = f'/api/game-data?group={group_id}'
+        if args.query:
+            path += '&' + args.query
+        tasks = [
+            asyncio.ensure_future(
+                poller(host, port, path, args.interval, args.timeout, stats,
+                       stop)) for _ in range(args.pollers)
+        ]
+        ws_url = f'ws://{host}:{port}/ws?group={group_id}'
+        tasks += [
+            asyncio.ensure_future(ws_client(ws_url, stats, stop))
+            for _ in range(args.websockets)
+        ]
+
+        intervals = []
+        start = last = time.monotonic()
+        client_cpu = time.process_time()
+        game_end = None
+        while True:
+            await asyncio.sleep(args.report_interval)
+            now = time.monotonic()
+            interval = stats.interval(now - last)
+            last = now
+            interval["t"] = now - start
+            interval["server"] = monitor.sample() if monitor else None
+            interval["log_bytes"] = (os.path.getsize(log_file)
+                                     if os.path.exists(log_file) else None)
+            intervals.append(interval)
+            if not args.json:
+                print(_format_interval(now - start, interval), flush=True)
+            if game is not None and game_end is None and game.poll() is not None:
+                game_end = now
+            if args.duration:
+                if now - start >= args.duration:
+                    break
+            elif game is None or (game_end is not None and
+                                  now - game_end >= args.tail):
+                break
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.monotonic() - start
+        stats.interval(0)
+
+        cpu_samples = monitor.cpu_samples if monitor else []
+        return {
+            "pollers": args.pollers,
+            "websockets": args.websockets,
+            "duration": elapsed,
+            "server_startup": startup,
+            "first_request": stats.first,
+            "game_seconds": (game_end - start) if game_end else None,
+            "requests": stats.total_requests,
+            "rps": stats.total_requests / elapsed,
+            "p50": percentile(stats.total_latencies, 50),
+            "p95": percentile(stats.total_latencies, 95),
+            "p99": percentile(stats.total_latencies, 99),
+            "max": max(stats.total_latencies, default=None),
+            "error_rate": (stats.total_failures / stats.total_requests
+                           if stats.total_requests else 0.0),
+            "statuses": {str(k): v for k, v in sorted(stats.statuses.items())},
+            "errors": stats.errors,
+            "mb_received": stats.bytes / (1 << 20),
+            "ws_connect_p95": percentile(stats.ws_connects, 95),
+            "ws_messages": stats.total_ws_messages,
+            "server_cpu_avg": (sum(cpu_samples) / len(cpu_samples)
+                               if cpu_samples else None),
+            "server_cpu_max": max(cpu_samples, default=None),
+            "server_rss_max_mb": (monitor.max_rss / (1 << 20)
+                                  if monitor else None),
+            # 负载生成器自身的 CPU, 接近 100% 时结果受客户端限制
+            "client_cpu": (time.process_time() - client_cpu) / elapsed * 100,
+            "intervals": intervals
+        }
+    finally:
+        for process in (game, server):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                process.wait()
+        if workdir is not None and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif workdir is not None:
+            print(f'Server directory: {workdir}', file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serve', action='store_true',
+                        help='在临时目录中启动服务器')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='--serve 时服务器的端口')
+    parser.add_argument('--keep', action='store_true',
+                        help='保留 --serve 的临时目录 (包含服务器日志)')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--server-pid', type=int, help='要监控的服务器进程')
+    parser.add_argument('--log-dir', default='./logs', help='服务器的日志目录')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='允许覆盖已有的组日志')
+    parser.add_argument('--group', default='1')
+    parser.add_argument('--no-game', action='store_true',
+                        help='不启动游戏进程, 测试已有的日志')
+    parser.add_argument('--rounds', type=int, default=24,
+                        help='游戏的 n_round (大约四轮一个昼夜)')
+    parser.add_argument('--rate', type=float, default=20.0,
+                        help='游戏每秒写出的日志行数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pollers', type=int, default=200,
+                        help='轮询 /api/game-data 的观众数')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='每个观众的轮询间隔 (秒)')
+    parser.add_argument('--query', default='',
+                        help='追加到 /api/game-data 的查询参数, 如 format=compact')
+    parser.add_argument('--websockets', type=int, default=0,
+                        help='保持 /ws 连接的观众数')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='单个请求的超时 (秒)')
+    parser.add_argument('--duration', type=float,
+                        help='测试时长 (秒), 默认到游戏结束后 --tail 秒')
+    parser.add_argument('--tail', type=float, default=5.0)
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+    if args.websockets and websockets is None:
+        parser.error('--websockets requires the websockets package')
+    if args.no_game and not args.duration:
+        parser.error('--no-game requires --duration')
+
+    result = asyncio.run(run(args))
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"\n{result['requests']} requests in {result['duration']:.1f}s "
+          f"({result['rps']:.1f} req/s), server ready in "
+          f"{result['server_startup']:.2f}s")
+    print(f"first request {_ms(result['first_request'])}")
+    print(f"latency p50 {_ms(result['p50'])}  p95 {_ms(result['p95'])}  "
+          f"p99 {_ms(result['p99'])}  max {_ms(result['max'])}")
+    print(f"error rate {result['error_rate'] * 100:.2f}%  "
+          f"statuses {result['statuses']}  errors {result['errors']}")
+    print(f"received {result['mb_received']:.1f}MB, "
+          f"{result['ws_messages']} websocket messages")
+    if result["server_rss_max_mb"] is not None:
+        cpu = result["server_cpu_avg"]
+        print(f"server cpu avg {'-' if cpu is None else f'{cpu:.0f}%'} "
+              f"max {result['server_cpu_max'] or 0:.0f}%, "
+              f"rss max {result['server_rss_max_mb']:.0f}MB")
+    print(f"client cpu {result['client_cpu']:.0f}%")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
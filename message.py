@@ -0,0 +1,88 @@
+"""解析后的消息: 紧凑的内部表示, 只在输出时转换为对话字典
+
+每条消息是一个带 ``__slots__`` 的对象, 没有实例字典; 发言者、角色、类型和
+player_name 使用驻留的字符串, living_players 是扫描器内共享的元组 (名单只在
+有玩家死亡时变化, 同一局游戏中只有少数几种). 不是 THOUGHTS/RESPONSE 的消息
+living_players 为 None, 输出时没有 player_name 和 living_players 字段.
+
+用 ``python bench.py memory`` 测量解析器常驻内存. 之前每条消息是
+``{"timestamp", "position", "data": {...}}`` 两层字典, 每条 living_players 都是
+一个新列表. 以 58k 条消息的 Group1 日志为例, 平均每条消息 (括号内为内容字符串
+之外的部分):
+
+    之前  文本日志 818 B (719 B), NDJSON 1079 B (980 B)
+    之后  文本日志 303 B (205 B), NDJSON  303 B (204 B)
+"""
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+
+def _intern(value: Any) -> Any:
+    """驻留字符串; 格式错误的日志中可能出现其他类型的值, 原样保留"""
+    return sys.intern(value) if type(value) is str else value
+
+
+class Message:
+    """一条消息: 位置、时间戳和对话字段"""
+
+    __slots__ = ('timestamp', 'position', 'speaker', 'content', 'type', 'role',
+                 'player_name', 'living_players')
+
+    def __init__(self,
+                 timestamp: Optional[str],
+                 position: int,
+                 speaker: str,
+                 content: str,
+                 type: Optional[str],
+                 role: str,
+                 player_name: Optional[str] = None,
+                 living_players: Any = None):
+        self.timestamp = timestamp
+        self.position = position
+        self.speaker = _intern(speaker)
+        self.content = content
+        self.type = _intern(type)
+        self.role = _intern(role)
+        self.player_name = _intern(player_name)
+        self.living_players = living_players
+
+    def to_dict(self) -> Dict[str, Any]:
+        """输出格式的对话条目, 每次返回新的字典, 可以直接修改"""
+        data = {
+            "speaker": self.speaker,
+            "content": self.content,
+            "type": self.type,
+            "role": self.role
+        }
+        if self.living_players is not None:
+            data["player_name"] = self.player_name
+            living = self.living_players
+            data["living_players"] = (list(living)
+                                      if isinstance(living, tuple) else living)
+        return data
+
+
+class LivingPlayers:
+    """living_players 元组的驻留表, 相同的名单共享同一个元组"""
+
+    def __init__(self):
+        self.tuples: Dict[Tuple, Tuple[str, ...]] = {}
+
+    def copy(self) -> 'LivingPlayers':
+        living = LivingPlayers()
+        living.tuples = dict(self.tuples)
+        return living
+
+    def get(self, players: Any) -> Any:
+        """共享的名单元组; 格式错误 (不是列表或包含不可哈希的值) 时原样返回"""
+        if not isinstance(players, (list, tuple)):
+            return players
+        players = tuple(players)
+        try:
+            shared = self.tuples.get(players)
+        except TypeError:
+            return players
+        if shared is None:
+            shared = self.tuples[players] = tuple(
+                _intern(player) for player in players)
+        return shared
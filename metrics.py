@@ -0,0 +1,343 @@
+"""请求和解析阶段的指标, 以 Prometheus 文本格式导出
+
+设置 PROFILE_DIR 后, 带 ``X-Profile: 1`` 请求头的请求会用 cProfile 记录,
+结果写入该目录下的 .pstats 文件, 文件路径在响应头 X-Profile-File 中返回.
+记录包括该请求交给线程池的任务 (解析和序列化), 见 ``profiled``.
+"""
+import cProfile
+import os
+import pstats
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from classifier import get_classifier
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1 << 20, 4 << 20,
+                16 << 20)
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+PROFILE_HEADER = 'X-Profile'
+
+Labels = Tuple[str, ...]
+
+
+def _process_start_time() -> float:
+    """进程的启动时间 (Unix 时间, 包括解释器启动和导入), 不能读取 /proc 时
+    使用本模块导入的时间"""
+    try:
+        with open('/proc/self/stat') as f:
+            # 进程名可能包含空格, 从最后一个 ')' 之后开始按空格分割
+            ticks = int(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return time.time()
+    return time.time() - (uptime - ticks / os.sysconf('SC_CLK_TCK'))
+
+
+PROCESS_START_TIME = _process_start_time()
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """只增不减的计数"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Labels, float] = {}
+        self.lock = Lock()  # 用于线程安全
+
+    def inc(self, labels: Labels = (), value: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} counter']
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(
+                    f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """固定分桶的直方图"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # {labels: [每个桶的计数..., 总和, 总数]}
+        self.values: Dict[Labels, List[float]] = {}
+        self.lock = Lock()  # 用于线程安全
+
+    def observe(self, labels: Labels, value: float) -> None:
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} histogram']
+        names = self.labels + ('le', )
+        with self.lock:
+            for labels, counts in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket'
+                                 f'{_format_labels(names, labels + (bound, ))}'
+                                 f' {cumulative}')
+                lines.append(f'{self.name}_bucket'
+                             f'{_format_labels(names, labels + ("+Inf", ))}'
+                             f' {counts[-1]}')
+                label_text = _format_labels(self.labels, labels)
+                lines.append(f'{self.name}_sum{label_text} {counts[-2]}')
+                lines.append(f'{self.name}_count{label_text} {counts[-1]}')
+        return lines
+
+
+class Gauge:
+    """导出时才从其他对象读取的值, 读取已有的计数时 kind 为 'counter'"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Dict[Labels, float]],
+                 kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self.collect().items()):
+            lines.append(
+                f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Registry:
+    """所有指标, render() 生成 /metrics 的内容"""
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = Lock()  # 用于线程安全
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_LATENCY = REGISTRY.register(
+    Histogram('werewolf_request_duration_seconds', '请求处理时间',
+              ('app', 'method', 'route', 'status')))
+RESPONSE_SIZE = REGISTRY.register(
+    Histogram('werewolf_response_size_bytes', '响应内容大小',
+              ('app', 'method', 'route'), SIZE_BUCKETS))
+PARSER_PHASE_SECONDS = REGISTRY.register(
+    Histogram('werewolf_parser_phase_seconds', '解析阶段耗时', ('phase', )))
+PARSER_PHASE_BLOCKS = REGISTRY.register(
+    Counter('werewolf_parser_phase_allocated_blocks_total',
+            '解析阶段新增的内存块数 (sys.getallocatedblocks 的净增量)',
+            ('phase', )))
+
+
+def _classifier_rules(field: str) -> Callable[[], Dict[Labels, float]]:
+    return lambda: {(rule["table"], rule["type"]): rule[field]
+                    for rule in get_classifier().stats()["rules"]}
+
+
+REGISTRY.register(
+    Gauge('process_start_time_seconds', '进程启动时间 (Unix 时间)', (),
+          lambda: {(): PROCESS_START_TIME}))
+REGISTRY.register(
+    Gauge('werewolf_classifier_rule_hits_total', '消息分类规则的命中次数',
+          ('table', 'type'), _classifier_rules("hits"), 'counter'))
+REGISTRY.register(
+    Gauge('werewolf_classifier_rule_seconds_total',
+          '由每条规则决定类型的消息的累计分类耗时', ('table', 'type'),
+          _classifier_rules("seconds"), 'counter'))
+REGISTRY.register(
+    Gauge('werewolf_classifier_seconds_total', '消息分类的累计耗时', (),
+          lambda: {(): get_classifier().stats()["seconds"]}, 'counter'))
+
+
+_caches = {}  # {名字: ResponseCache}
+
+
+def register_cache(name: str, cache) -> None:
+    """导出 ResponseCache 的命中、未命中、条目数和字节数"""
+    _caches[name] = cache
+
+
+def _cache_values(attribute: Callable) -> Callable[[], Dict[Labels, float]]:
+    return lambda: {(name, ): attribute(cache)
+                    for name, cache in list(_caches.items())}
+
+
+REGISTRY.register(
+    Gauge('werewolf_cache_hits_total', '缓存命中次数', ('cache', ),
+          _cache_values(lambda cache: cache.hits), 'counter'))
+REGISTRY.register(
+    Gauge('werewolf_cache_misses_total', '缓存未命中次数', ('cache', ),
+          _cache_values(lambda cache: cache.misses), 'counter'))
+REGISTRY.register(
+    Gauge('werewolf_cache_entries', '缓存条目数', ('cache', ),
+          _cache_values(lambda cache: len(cache.entries))))
+REGISTRY.register(
+    Gauge('werewolf_cache_bytes', '缓存的总字节数', ('cache', ),
+          _cache_values(lambda cache: cache.size)))
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """记录一个解析阶段的耗时和新增的内存块数"""
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PARSER_PHASE_SECONDS.observe((name, ), time.perf_counter() - start)
+        PARSER_PHASE_BLOCKS.inc((name, ),
+                                max(0, sys.getallocatedblocks() - blocks))
+
+
+def observe_request(app: str, method: str, route: str, status: int,
+                    seconds: float, size: Optional[int]) -> None:
+    REQUEST_LATENCY.observe((app, method, route, str(status)), seconds)
+    if size is not None:
+        RESPONSE_SIZE.observe((app, method, route), size)
+
+
+_profile_lock = Lock()  # cProfile 同一时间只能有一个在运行
+
+
+class RequestProfile:
+    """一个请求的 cProfile 记录: 事件循环线程上的一份, 加上每个线程池任务各一份
+
+    cProfile 只记录调用 enable() 的线程, 解析和序列化在线程池中进行, 因此任务
+    在工作线程中单独记录, 写入文件时合并.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.jobs: List[cProfile.Profile] = []
+        self.lock = Lock()  # 用于线程安全
+
+
+_request_profile: ContextVar[Optional[RequestProfile]] = ContextVar(
+    'request_profile', default=None)
+
+
+def profiling() -> bool:
+    """当前请求是否正在记录"""
+    return _request_profile.get() is not None
+
+
+def profiled(func: Callable) -> Callable:
+    """包装要交给线程池的函数: 当前请求正在记录时, 在工作线程中也记录它的调用
+
+    必须在事件循环线程 (请求的上下文) 中调用, 返回的函数在工作线程中运行.
+    """
+    profile = _request_profile.get()
+    if profile is None:
+        return func
+
+    def run(*args):
+        job = cProfile.Profile()
+        try:
+            job.enable()
+        except ValueError:
+            # Python 3.12 起 cProfile 对所有线程生效, 不能再启动第二个,
+            # 工作线程的调用已经记录在请求的记录中
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            job.disable()
+            with profile.lock:
+                profile.jobs.append(job)
+
+    return run
+
+
+def start_profile(headers) -> Optional[RequestProfile]:
+    """请求带 X-Profile: 1 且设置了 PROFILE_DIR 时开始记录, 否则返回 None"""
+    if not PROFILE_DIR or headers.get(PROFILE_HEADER) != '1':
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profile = RequestProfile()
+    try:
+        profile.profiler.enable()
+    except ValueError:
+        _profile_lock.release()
+        return None
+    # 中间件设置的上下文变量传递给路由处理函数
+    _request_profile.set(profile)
+    return profile
+
+
+def finish_profile(profile: Optional[RequestProfile],
+                   route: str) -> Optional[str]:
+    """停止记录, 合并线程池任务的记录并写入 .pstats 文件, 返回文件路径"""
+    if profile is None:
+        return None
+    try:
+        profile.profiler.disable()
+        _request_profile.set(None)
+        stats = pstats.Stats(profile.profiler)
+        with profile.lock:
+            for job in profile.jobs:
+                stats.add(job)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r'[^\w-]+', '_', route).strip('_') or 'root'
+        path = os.path.join(
+            PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{slug}-'
+            f'{time.perf_counter_ns()}.pstats')
+        stats.dump_stats(path)
+        return path
+    finally:
+        _profile_lock.release()
@@ -1,268 +1,716 @@
 import re
 import json
 import os
-from typing import Dict, List, Tuple, Any, Optional
+import codecs
+import mmap
+import pickle
+import secrets
+from functools import lru_cache
+from threading import Lock
+from typing import (Any, BinaryIO, Dict, Iterator, List, Optional, Tuple,
+                    Union)
+
+import metrics
+from classifier import MessageClassifier, get_classifier
+from message import LivingPlayers, Message
+from timeline import Timeline
+
+TIMESTAMP_PATTERN = re.compile(
+    r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})')
+# 以日期开头的行都是新记录的开始
+DATE_START_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+LOG_LEVEL_PATTERN = re.compile(TIMESTAMP_PATTERN.pattern +
+                               r' \| (?:INFO|ERROR|WARNING)')
+SPEAKER_PATTERN = re.compile(r'(Player\d+|Moderator)\((\w+)\):\s*')
+SETUP_PLAYER_PATTERN = re.compile(r'Player(\d+): ([^,]+),')
+GAME_OVER_PATTERN = re.compile(r'Game over! ', re.IGNORECASE)
+# JSON块内需要关注的字符, 其余字符由正则引擎直接跳过
+BLOCK_TOKEN_PATTERN = re.compile(r'["\\{}]')
+# 单个JSON块的最大长度和嵌套深度, 超过后视为格式错误并放弃
+MAX_BLOCK_SIZE = 1 << 20
+MAX_BLOCK_DEPTH = 32
+ROLE_NAMES = ['Moderator', 'Seer', 'Witch', 'Guard', 'Werewolf', 'Villager']
+# 用于检测日志文件被覆盖或轮转的文件头指纹长度
+HEAD_FINGERPRINT_SIZE = 64
+# 每次读取和扫描的字节数
+CHUNK_SIZE = 1 << 18
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# 持久解析器状态的快照, 服务器重启后从这里恢复, 不必重新解析整个日志
+SNAPSHOT_FILE = os.environ.get('PARSE_SNAPSHOT_FILE',
+                               os.path.join(ROOT, 'parse_snapshot.pickle'))
+# 解析状态的格式变化时加一, 旧的快照不再使用
+SNAPSHOT_VERSION = 2
+
+
+def setup_player(player_id: int, role: str) -> Dict:
+    """游戏设置中的一个玩家"""
+    return {
+        "id": player_id,
+        "name": f"Player{player_id}",
+        "role": role,
+        "avatar": f"/public/avatars/{role}.jpg",
+        "win": 0,
+        "loss": 0
+    }
+
+
+def detect_format(head: str) -> str:
+    """根据文件开头判断日志格式: 'ndjson' (结构化事件流) 或 'text' (MetaGPT 标准输出)
+
+    第一行是带 speaker 或 players 字段的 JSON 对象时为事件流; 第一行还没有
+    写完时只按前缀判断.
+    """
+    text = head.lstrip()
+    if not text.startswith('{'):
+        return 'text'
+    line, newline, _ = text.partition('\n')
+    try:
+        event = json.loads(line)
+    except ValueError:
+        if newline:
+            return 'text'
+        return 'ndjson' if ('"speaker"' in line
+                            or '"players"' in line) else 'text'
+    if isinstance(event, dict) and ("speaker" in event or "players" in event):
+        return 'ndjson'
+    return 'text'
+
+
+class LogScanner:
+    """单遍逐行扫描日志, 提取玩家/主持人发言、THOUGHTS/RESPONSE JSON块、游戏设置和游戏结果
+
+    每一行只被常数个锚定或字面量正则扫描一次, JSON块内按字符串和括号状态
+    跳跃扫描, 最坏情况下也是线性时间. 未闭合的字符串 (行尾仍在字符串内)、
+    未闭合的块 (下一个块开始) 或过长、嵌套过深的块都会被丢弃, 不会吞掉后续内容.
+    JSON块内穿插的 INFO/ERROR/WARNING 日志行在扫描时直接剥离.
+
+    内容可以分多次 ``feed()``, 未写完的最后一行、正在收集的发言和JSON块都保留在
+    扫描状态中; 返回的消息按位置有序.
+    """
+
+    def __init__(self, classifier: MessageClassifier):
+        self.classifier = classifier
+        self.position = 0  # 下一行的起始位置
+        self.partial = []  # 未以换行结束的最后一行
+        self.timestamp = None  # 最近的时间戳
+        self.record = None  # 正在收集的发言
+        self.block = None  # 正在收集的JSON块
+        self.setup = None  # 正在收集的游戏设置
+        self.setup_position = None
+        self.players = []
+        self.result = None  # (position, text)
+        self.living = LivingPlayers()  # 克隆的扫描器共享
+
+    def clone(self) -> 'LogScanner':
+        """复制扫描状态, 用于临时解析尾部内容"""
+        scanner = LogScanner(self.classifier)
+        scanner.__dict__.update(self.__dict__)
+        scanner.partial = list(self.partial)
+        if self.record is not None:
+            scanner.record = dict(self.record, lines=list(self.record["lines"]))
+        if self.block is not None:
+            scanner.block = dict(self.block,
+                                 parts=list(self.block["parts"]),
+                                 events=list(self.block["events"]))
+        if self.setup is not None:
+            scanner.setup = list(self.setup)
+        return scanner
+
+    def feed(self, text: str) -> List[Message]:
+        """扫描新追加的内容, 返回其中已完整的消息"""
+        out = []
+        if '\n' not in text:
+            self.partial.append(text)
+            return out
+
+        self.partial.append(text)
+        lines = ''.join(self.partial).split('\n')
+        self.partial = [lines.pop()]
+        for line in lines:
+            self._scan_line(line, out)
+            self.position += len(line) + 1
+        self._classify(out)
+        return out
+
+    def finish(self) -> List[Message]:
+        """把剩余内容当作文件结尾处理, 返回剩余的消息"""
+        out = []
+        line = ''.join(self.partial)
+        self.partial = []
+        if line:
+            self._scan_line(line, out)
+            self.position += len(line)
+        self._close_record(out)
+        if self.block is not None:
+            self._drop_block(out)
+        if self.setup is not None:
+            self.players, self.setup = self.setup, None
+        self._classify(out)
+        return out
+
+    def _classify(self, out: List[Message]) -> None:
+        """批量判断本次产出的发言消息的类型"""
+        self.classifier.classify_batch(
+            [msg for msg in out if msg.type is None])
+
+    def _scan_line(self, line: str, out: List[Message]) -> None:
+        """扫描一行完整内容"""
+        line = line.rstrip('\r')
+        if self.block is not None:
+            # 行首新的 '{' 说明上一个块没有闭合
+            if not (line.startswith('{') and self.block["depth"] == 1
+                    and not self.block["in_string"]):
+                self._scan_block_line(line, out)
+                return
+            self._drop_block(out)
+
+        if self.setup is not None:
+            match = SETUP_PLAYER_PATTERN.match(line)
+            if match:
+                self.setup.append(self._setup_player(match))
+                return
+            self.players, self.setup = self.setup, None
+
+        # 记录的开始: 时间戳日志行、发言行或JSON块
+        speaker_at = 0
+        is_record = False
+        if DATE_START_PATTERN.match(line):
+            is_record = True
+            speaker_at = -1
+            match = LOG_LEVEL_PATTERN.match(line)
+            if match:
+                self.timestamp = match.group(1)
+                separator = line.find(' - ', match.end())
+                if separator != -1:
+                    speaker_at = separator + 3
+            else:
+                match = TIMESTAMP_PATTERN.match(line)
+                if match:
+                    self.timestamp = match.group(1)
+        speaker = (SPEAKER_PATTERN.match(line, speaker_at)
+                   if speaker_at >= 0 else None)
+        stripped = line.lstrip()
+        is_block = stripped.startswith('{')
+
+        if is_record or speaker or is_block:
+            self._close_record(out)
+            if is_block:
+                self._open_block(line, len(line) - len(stripped), out)
+                return
+            if speaker:
+                self.record = {
+                    "timestamp": self.timestamp,
+                    "position": self.position,
+                    "speaker": speaker.group(1),
+                    "role": speaker.group(2),
+                    "lines": [line[speaker.end():]],
+                    "game_over": None
+                }
+        elif self.record is not None:
+            self.record["lines"].append(line)
+
+        self._scan_game_markers(line, out)
+
+    def _scan_game_markers(self, line: str, out: List[Message]) -> None:
+        """检测游戏设置和游戏结束"""
+        if not self.players and self.setup is None and line.endswith(
+                "Game setup:"):
+            self.setup = []
+            self.setup_position = self.position
+        if self.result is None:
+            match = GAME_OVER_PATTERN.search(line)
+            if match:
+                self.result = (self.position + match.start(),
+                               line[match.end():])
+                message = self._game_over_message(*self.result)
+                # 结束语本身就在一条发言中时, 用结束消息代替这条发言
+                if self.record is not None:
+                    self.record["game_over"] = message
+                elif self.block is not None:
+                    self.block["events"].append(message)
+                else:
+                    out.append(message)
+
+    def _setup_player(self, match: 're.Match') -> Dict:
+        """生成游戏设置中的玩家信息"""
+        return setup_player(int(match.group(1)), match.group(2).strip())
+
+    def _game_over_message(self, position: int, result: str) -> Message:
+        """生成游戏结束的主持人消息"""
+        # 时间戳为 None, 或者可以找到最近的时间戳
+        return Message(None, position, "Moderator", f"Game over! {result}",
+                       "Announcement", "Moderator")
+
+    def _message(self, timestamp: Optional[str], position: int, speaker: str,
+                 role: str, message: str) -> Optional[Message]:
+        """生成一条发言消息, 无效的消息返回 None"""
+        message = message.strip()
+        # 检查消息是否为空或者只包含特定的角色名
+        if not message or message in ROLE_NAMES:
+            return None
+        # 类型在产出前由 _classify 批量填写
+        return Message(timestamp, position, speaker, message, None, role)
+
+    def _close_record(self, out: List[Message]) -> None:
+        """结束正在收集的发言"""
+        record, self.record = self.record, None
+        if record is None:
+            return
+        if record["game_over"] is not None:
+            out.append(record["game_over"])
+            return
+        message = self._message(record["timestamp"], record["position"],
+                                record["speaker"], record["role"],
+                                '\n'.join(record["lines"]))
+        if message is not None:
+            out.append(message)
+
+    def _open_block(self, line: str, start: int, out: List[Message]) -> None:
+        """开始收集一个JSON块"""
+        self.block = {
+            "timestamp": self.timestamp,
+            "position": self.position + start,
+            "parts": [],
+            "size": 0,
+            "depth": 0,
+            "in_string": False,
+            "events": []
+        }
+        self._scan_block_line(line[start:], out)
+
+    def _drop_block(self, out: List[Message]) -> None:
+        """放弃格式错误或未闭合的JSON块, 只保留块内穿插的日志行"""
+        block, self.block = self.block, None
+        out.extend(sorted(block["events"], key=lambda x: x.position))
+
+    def _scan_block_line(self, line: str, out: List[Message]) -> None:
+        """扫描JSON块中的一行, 剥离穿插的日志行, 跟踪字符串和括号状态"""
+        block = self.block
+        position = self.position
+        if block["size"] == 0:
+            position = block["position"]
+        log_match = LOG_LEVEL_PATTERN.search(line)
+        if log_match:
+            # 日志行及其换行符都不属于JSON内容
+            self._scan_log_line(line[log_match.start():],
+                                position + log_match.start(), block["events"])
+            line = line[:log_match.start()]
+            newline = ''
+        else:
+            newline = '\n'
+
+        depth = block["depth"]
+        in_string = block["in_string"]
+        escaped = -1
+        for match in BLOCK_TOKEN_PATTERN.finditer(line):
+            i = match.start()
+            if i == escaped:
+                continue
+            char = line[i]
+            if in_string:
+                if char == '\\':
+                    escaped = i + 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+                if depth > MAX_BLOCK_DEPTH:
+                    self._drop_block(out)
+                    return
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    block["parts"].append(line[:i + 1])
+                    self._close_block(out)
+                    return
+
+        block["parts"].append(line + newline)
+        block["size"] += len(line) + 1
+        block["depth"] = depth
+        block["in_string"] = in_string
+        # JSON字符串不能跨行, 块过长也视为格式错误
+        if (in_string and newline) or block["size"] > MAX_BLOCK_SIZE:
+            self._drop_block(out)
+
+    def _close_block(self, out: List[Message]) -> None:
+        """JSON块闭合, 解析 THOUGHTS/RESPONSE"""
+        block = self.block
+        content = ''.join(block["parts"])
+        position = block["position"]
+        events = block["events"]
+        try:
+            data = json.loads(content)
+            if (isinstance(data, dict) and "ROLE" in data
+                    and isinstance(data.get("RESPONSE"), str)):
+                events.extend(self._block_messages(data, block["timestamp"],
+                                                   position))
+        except json.JSONDecodeError as e:
+            if '"ROLE"' in content:
+                print(f"Failed to parse JSON at position {position}: {e}")
+        self._drop_block(out)
+
+    def _block_messages(self, data: Dict, timestamp: Optional[str],
+                        position: int) -> List[Message]:
+        """把 THOUGHTS/RESPONSE JSON 转换为消息"""
+        speaker = data.get("PLAYER_NAME", "Unknown")
+        role = data.get("ROLE", "")
+        player_name = data.get("PLAYER_NAME", "")
+        living = self.living.get(data.get("LIVING_PLAYERS", []))
+        messages = []
+        if "THOUGHTS" in data:
+            messages.append(
+                Message(timestamp, position, speaker, data["THOUGHTS"],
+                        "Thought", role, player_name, living))
+        messages.append(
+            Message(timestamp, position + 1, speaker, data["RESPONSE"],
+                    "Response", role, player_name, living))
+        return messages
+
+    def _scan_log_line(self, line: str, position: int,
+                       out: List[Message]) -> None:
+        """处理JSON块中穿插的日志行"""
+        timestamp = TIMESTAMP_PATTERN.match(line).group(1)
+        self.timestamp = timestamp
+        speaker = SPEAKER_PATTERN.search(line)
+        if speaker:
+            message = self._message(timestamp, position, speaker.group(1),
+                                    speaker.group(2), line[speaker.end():])
+            if message is not None:
+                out.append(message)
+        if self.result is None:
+            match = GAME_OVER_PATTERN.search(line)
+            if match:
+                self.result = (position + match.start(), line[match.end():])
+                out.append(self._game_over_message(*self.result))
+
+
+class EventScanner:
+    """逐行读取结构化的 NDJSON 事件流, 产出与 LogScanner 相同的消息事件
+
+    每行一个 JSON 对象::
+
+        {"players": [{"id": 1, "role": "Seer"}, ...]}           # 游戏设置
+        {"timestamp": "...", "speaker": "Player1", "role": "Seer",
+         "type": "Say", "content": "...",
+         "player_name": "Player1", "living_players": [...]}     # 一条消息
+
+    type 可以省略, 省略时由分类器判断; 只有 THOUGHTS/RESPONSE 才带
+    living_players. 主持人以 "Game over!" 开头的消息就是游戏结果.
+    无法解析的行被跳过, 未以换行结束的最后一行保留到下次 ``feed()``.
+    """
+
+    def __init__(self, classifier: MessageClassifier):
+        self.classifier = classifier
+        self.position = 0  # 下一行的起始位置
+        self.partial = []  # 未以换行结束的最后一行
+        self.setup_position = None
+        self.players = []
+        self.result = None  # (position, text)
+        self.skipped = 0  # 无法解析的行数
+        self.living = LivingPlayers()  # 克隆的扫描器共享
+        self.timestamp = None  # 上一条消息的时间戳, 相同的时间戳共享同一个字符串
+
+    def clone(self) -> 'EventScanner':
+        """复制扫描状态, 用于临时解析尾部内容"""
+        scanner = EventScanner(self.classifier)
+        scanner.__dict__.update(self.__dict__)
+        scanner.partial = list(self.partial)
+        return scanner
+
+    def feed(self, text: str) -> List[Message]:
+        """扫描新追加的内容, 返回其中已完整的消息"""
+        out = []
+        self.partial.append(text)
+        if '\n' not in text:
+            return out
+        lines = ''.join(self.partial).split('\n')
+        self.partial = [lines.pop()]
+        self._scan_lines(lines, out)
+        return out
+
+    def finish(self) -> List[Message]:
+        """把剩余内容当作文件结尾处理, 返回剩余的消息"""
+        out = []
+        line = ''.join(self.partial)
+        self.partial = []
+        if line:
+            self._scan_lines([line], out)
+            self.position -= 1  # 最后一行没有换行符
+        return out
+
+    def _scan_lines(self, lines: List[str], out: List[Message]) -> None:
+        """解析完整的行; 整批行先作为一个 JSON 数组解析, 只有其中有格式错误的行时
+        才逐行解析"""
+        positions = []
+        position = self.position
+        for line in lines:
+            positions.append(position)
+            position += len(line) + 1
+        batch = [(pos, line) for pos, line in zip(positions, lines)
+                 if line and not line.isspace()]
+        try:
+            events = json.loads('[' + ','.join(line for _, line in batch) +
+                                ']')
+        except ValueError:
+            events = None
+        if events is None or len(events) != len(batch):
+            events = []
+            for _, line in batch:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    events.append(None)
+        for (pos, _), event in zip(batch, events):
+            self.position = pos
+            self._scan_event(event, out)
+        self.position = position
+        self.classifier.classify_batch(
+            [msg for msg in out if msg.type is None])
+
+    def _scan_event(self, event: Any, out: List[Message]) -> None:
+        """处理一个事件, 位置为 self.position"""
+        if not isinstance(event, dict):
+            self.skipped += 1
+            return
+        if "players" in event:
+            self.players = [
+                setup_player(int(player["id"]), player.get("role", ""))
+                for player in event["players"]
+            ]
+            self.setup_position = self.position
+            return
+        speaker = event.get("speaker")
+        content = event.get("content")
+        if not isinstance(speaker, str) or not isinstance(content, str):
+            self.skipped += 1
+            return
+
+        message_type = event.get("type")
+        player_name = living = None
+        if "living_players" in event:
+            player_name = event.get("player_name", speaker)
+            living = self.living.get(event["living_players"])
+        if speaker == "Moderator" and self.result is None:
+            match = GAME_OVER_PATTERN.match(content)
+            if match:
+                self.result = (self.position, content[match.end():])
+                message_type = "Announcement"
+        timestamp = event.get("timestamp")
+        if timestamp == self.timestamp:
+            timestamp = self.timestamp
+        self.timestamp = timestamp
+        out.append(
+            Message(timestamp, self.position, speaker, content,
+                    message_type, event.get("role", ""), player_name, living))
+
+
+Scanner = Union[LogScanner, EventScanner]
 
 
 class LogParser:
+    """可恢复的日志解析器
+
+    支持 MetaGPT 的文本日志和结构化的 NDJSON 事件流, 按文件的第一行自动选择.
 
-    def __init__(self, filename: str):
+    记录已读取的字节偏移和扫描状态, 每次 ``update()`` 只扫描新追加的内容;
+    最后一条可能尚未写完的记录保留在扫描器中, 等到后续记录出现后再提交.
+    检测到文件被截断或轮转时回退到全量重解析.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 classifier: Optional[MessageClassifier] = None):
         self.filename = filename
-        self.content = self._read_file()
-        self.players = []
+        self.classifier = classifier or get_classifier()
+        self.timestamp_pattern = TIMESTAMP_PATTERN.pattern
+        self.lock = Lock()  # 用于线程安全
+        self.generation = 0  # 每次重置时随机生成, 见 _reset
+        self._reset()
+
+    def _reset(self) -> None:
+        """清空所有解析状态"""
+        # 游标中的代号随机生成, 释放后重建的解析器 (可能对应另一局游戏)
+        # 和重启后的服务器都不会把之前的游标当作有效
+        generation = self.generation
+        while generation == self.generation:
+            generation = secrets.randbits(48)
+        self.generation = generation
         self.messages = []
-        self.timestamp_pattern = r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})'
-
-    def _read_file(self) -> str:
-        """读取日志文件"""
-        if not os.path.exists(self.filename):
-            return ""
-        with open(self.filename, 'r', encoding='utf-8') as f:
-            return f.read()
-
-    def _parse_game_setup(self) -> None:
-        """解析游戏设置信息"""
-        setup_pattern = r"Game setup:\n((?:Player\d+: [^,]+,\n?)+)"
-        setup_match = re.search(setup_pattern, self.content)
-
-        if setup_match:
-            player_pattern = r"Player(\d+): ([^,]+),"
-            for match in re.finditer(player_pattern, setup_match.group(1)):
-                player_id = int(match.group(1))
-                role = match.group(2).strip()
-                self.players.append({
-                    "id": player_id,
-                    "name": f"Player{player_id}",
-                    "role": role,
-                    "avatar": f"/public/avatars/{role}.jpg",
-                    "win": 0,
-                    "loss": 0
-                })
+        self.timeline = Timeline()  # 已提交消息的轮次索引
+        self.scanner = LogScanner(self.classifier)
+        self.format = None  # 'text' 或 'ndjson', 读到第一行后确定
+        self._undetected = ''  # 确定格式之前读到的内容
+        self.offset = 0  # 已读取的字节偏移
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._identity = None
+        self._head = b''
 
-        # 添加主持人
-        self.players.append({
-            "id": 0,
-            "name": "Moderator",
-            "role": "Moderator"
-        })
+    def iter_events(self, final: bool = False) -> Iterator[Message]:
+        """从检查点开始分块读取新追加的内容, 按文件顺序逐条产出消息事件
 
-    def _determine_message_type(self, speaker: str, message: str,
-                                role: str) -> str:
-        """判断消息类型"""
-        if speaker == "Moderator":
-            if any(keyword in message.lower()
-                   for keyword in ["choose", "who", "would you like"]):
-                return "Question"
-            if "understood" in message.lower():
-                return "Confirmation"
-            if any(keyword in message.lower()
-                   for keyword in ["killed", "eliminated", "game over"]):
-                return "Announcement"
-            return "Instruction"
-
-        if "ready to" in message:
-            return "Preparation"
-        if any(action in message for action in [
-                "vote to eliminate", "Hunt", "Protect", "Verify", "Poison",
-                "Save", "Pass"
-        ]):
-            return "Action"
-
-        return "Say"
-
-    def _clean_json_content(self, content: str) -> Tuple[str, List[str]]:
-        """清理JSON内容"""
-        # 移除INFO/ERROR等日志行
-        log_lines = re.findall(
-            r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3} \| (?:INFO|ERROR|WARNING).*?\n',
-            content)
-        cleaned = re.sub(
-            r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3} \| (?:INFO|ERROR|WARNING).*?\n',
-            '', content)
-        # 移除空行
-        cleaned = re.sub(r'\n\s*\n', '\n', cleaned)
-        return cleaned, log_lines
-
-    def _parse_messages(self) -> None:
-        """解析所有消息"""
-        # 提取所有时间戳行和它们的位置
-        timestamps = [
-            (m.group(1), m.start())
-            for m in re.finditer(self.timestamp_pattern, self.content)
-        ]
-
-        # 解析JSON块
-        json_pattern = r'{\s*"ROLE":[^{]*?"RESPONSE":\s*"[^"]*"[^}]*?}'
-        json_matches = list(re.finditer(json_pattern, self.content, re.DOTALL))
-        json_positions = [(m.start(), m.end()) for m in json_matches]
-
-        # 函数用于检查位置是否在任何JSON块内
-        def is_in_json_block(pos):
-            return any(start <= pos <= end for start, end in json_positions)
-
-        def is_valid_message(message, speaker, role):
-            # 如果消息只包含时间戳，则不是有效消息
-            if not message or not speaker or not role:
-                return False
+        内存占用只取决于分块大小和最长的一条消息, 与文件大小无关.
+        ``final`` 为真时文件被当作已经写完: 通过 mmap 读取, 并在最后产出
+        尚未结束的记录, 之后不能再继续增量读取. 正在写入的日志仍用普通读取,
+        避免文件在映射期间被 `>` 截断时访问映射区域触发 SIGBUS.
+        """
+        try:
+            f = open(self.filename, 'rb')
+        except FileNotFoundError:
+            if self.offset:
+                self._reset()
+            return
 
-            # 清理时间戳
-            cleaned_message = re.sub(self.timestamp_pattern, '',
-                                     message).strip()
+        with f:
+            st = os.fstat(f.fileno())
+            identity = (st.st_dev, st.st_ino)
+            if self.offset:
+                # 文件被截断 (例如 `>` 重定向覆盖)、替换或轮转时全量重解析
+                head = f.read(len(self._head))
+                if (identity != self._identity or st.st_size < self.offset
+                        or head != self._head):
+                    self._reset()
+            self._identity = identity
 
-            # 检查清理后的消息是否为空或者只包含特定的角色名
-            if not cleaned_message or cleaned_message in [
-                    'Moderator', 'Seer', 'Witch', 'Guard', 'Werewolf',
-                    'Villager'
-            ]:
-                return False
+            for data in self._iter_chunks(f, st.st_size, final):
+                if len(self._head) < HEAD_FINGERPRINT_SIZE:
+                    self._head = (self._head +
+                                  data)[:HEAD_FINGERPRINT_SIZE]
+                self.offset += len(data)
+                yield from self._feed(self._decoder.decode(data))
 
-            return True
+        if final:
+            yield from self._feed(self._decoder.decode(b'', final=True), True)
+            yield from self.scanner.finish()
 
-        # 处理所有常规消息
-        message_pattern = r'(?:' + self.timestamp_pattern + r' \| (?:INFO|ERROR|WARNING).*? - )?(Player\d+|Moderator)\((\w+)\):\s*(.*?)(?=(?:\n\d{4}-\d{2}-\d{2}|\n(?:Player\d+|Moderator)\(|\n{|$))'
+    def _feed(self, text: str, final: bool = False) -> List[Message]:
+        """把解码后的内容交给扫描器; 第一行完整后才根据它选择扫描器"""
+        if self.format is None:
+            text = self._undetected + text
+            if '\n' not in text.lstrip() and not final:
+                self._undetected = text
+                return []
+            self._undetected = ''
+            self.format = detect_format(text)
+            if self.format == 'ndjson':
+                self.scanner = EventScanner(self.classifier)
+        return self.scanner.feed(text)
 
-        for match in re.finditer(message_pattern, self.content, re.DOTALL):
-            start_pos = match.start()
+    def _iter_chunks(self, f: BinaryIO, size: int,
+                     use_mmap: bool) -> Iterator[bytes]:
+        """按 CHUNK_SIZE 读取检查点之后的内容"""
+        if size <= self.offset:
+            return
+        if not use_mmap:
+            f.seek(self.offset)
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    return
+                yield data
 
-            # 跳过JSON块中的匹配
-            if is_in_json_block(start_pos):
-                continue
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            for start in range(self.offset, size, CHUNK_SIZE):
+                yield mm[start:start + CHUNK_SIZE]
 
-            speaker = match.group(1)
-            role = match.group(2)
-            message = match.group(3).strip()
-
-            # 获取最近的时间戳
-            timestamp = next((ts[0] for ts in timestamps if ts[1] < start_pos),
-                             None)
-
-            # 清理消息中的时间戳
-            if timestamp:
-                message = message.replace(timestamp, '').strip()
-
-            # 只添加有效的消息
-            if is_valid_message(message, speaker, role):
-                msg_type = self._determine_message_type(speaker, message, role)
-                self.messages.append({
-                    "timestamp": timestamp,
-                    "position": start_pos,
-                    "data": {
-                        "speaker": speaker,
-                        "content": message,
-                        "type": msg_type,
-                        "role": role
-                    }
-                })
-
-        # 处理JSON块
-        for match in json_matches:
-            json_content = match.group()
-            start_pos = match.start()
-
-            # 清理JSON内容并获取日志行
-            cleaned_json, log_lines = self._clean_json_content(json_content)
-
-            # 处理日志行
-            self._process_log_lines(log_lines, timestamps)
+    def update(self) -> bool:
+        """增量解析新追加的日志内容, 返回是否有变化"""
+        offset = self.offset
+        generation = self.generation
+        # 读取过程中可能发生重置, 先收集再追加到 (可能是新的) 消息列表
+        with metrics.phase('scan'):
+            messages = list(self.iter_events())
+        self.timeline.feed(messages, len(self.messages))
+        self.messages.extend(messages)
+        return self.offset != offset or self.generation != generation
 
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """可以序列化的解析状态, 还没有读取任何内容时返回 None"""
+        with self.lock:
+            if not self.offset:
+                return None
+            # 复制会继续变化的状态, 序列化可以在锁外进行
+            scanner = self.scanner.clone()
+            scanner.classifier = None
+            scanner.living = scanner.living.copy()
             try:
-                data = json.loads(cleaned_json)
-                timestamp = next(
-                    (ts[0] for ts in timestamps if ts[1] < start_pos), None)
-
-                if "THOUGHTS" in data:
-                    self.messages.append({
-                        "timestamp": timestamp,
-                        "position": start_pos,
-                        "data": {
-                            "speaker": data.get("PLAYER_NAME", "Unknown"),
-                            "content": data["THOUGHTS"],
-                            "type": "Thought",
-                            "role": data.get("ROLE", ""),
-                            "player_name": data.get("PLAYER_NAME", ""),
-                            "living_players": data.get("LIVING_PLAYERS", [])
-                        }
-                    })
-
-                if "RESPONSE" in data:
-                    self.messages.append({
-                        "timestamp": timestamp,
-                        "position": start_pos + 1,
-                        "data": {
-                            "speaker": data.get("PLAYER_NAME", "Unknown"),
-                            "content": data["RESPONSE"],
-                            "type": "Response",
-                            "role": data.get("ROLE", ""),
-                            "player_name": data.get("PLAYER_NAME", ""),
-                            "living_players": data.get("LIVING_PLAYERS", [])
-                        }
-                    })
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON at position {start_pos}: {e}")
-
-    def _process_log_lines(self, log_lines: List[str],
-                           timestamps: List[Tuple[str, int]]) -> None:
-        """处理日志行"""
-        for log_line in log_lines:
-            # 提取玩家消息
-            player_msg_match = re.search(
-                r'(Player\d+|Moderator)\((\w+)\):\s*(.*?)$', log_line)
-            if player_msg_match:
-                speaker = player_msg_match.group(1)
-                role = player_msg_match.group(2)
-                message = player_msg_match.group(3).strip()
-
-                msg_type = self._determine_message_type(speaker, message, role)
-                timestamp = re.match(self.timestamp_pattern, log_line)
-
-                if timestamp:
-                    self.messages.append({
-                        "timestamp":
-                        timestamp.group(1),
-                        "position":
-                        self.content.find(log_line),
-                        "data": {
-                            "speaker": speaker,
-                            "content": message,
-                            "type": msg_type,
-                            "role": role
-                        }
-                    })
-
-    def _parse_game_result(self) -> int:
-        """解析游戏结果"""
-        current_round = 0
-        result_pattern = r"Game over! (.*?)\n"
-        match = re.search(result_pattern, self.content,
-                          re.DOTALL | re.IGNORECASE)
-
-        if match:
-            current_round += 1
-            result = match.group(1)
-            is_good_guys_win = "good guys" in result.lower()
-
-            # 添加这条消息到对话中
-            self.messages.append({
-                "timestamp": None,  # 或者可以找到最近的时间戳
-                "position": match.start(),
-                "data": {
-                    "speaker": "Moderator",
-                    "content": f"Game over! {result}",
-                    "type": "Announcement",
-                    "role": "Moderator"
-                }
-            })
-
-            for player in self.players:
-                if player["role"] == "Moderator":
-                    continue
-                is_good = player["role"] not in ["Werewolf"]
-                if is_good == is_good_guys_win:
-                    player["win"] += 1
-                else:
-                    player["loss"] += 1
+                st = os.stat(self.filename)
+                # 文件在上次读取之后又有变化时不记录修改时间, 恢复时按追加处理
+                mtime = (st.st_mtime_ns if st.st_size == self.offset else None)
+            except OSError:
+                return None
+            return {
+                "filename": self.filename,
+                "generation": self.generation,
+                "format": self.format,
+                "offset": self.offset,
+                "mtime": mtime,
+                "identity": self._identity,
+                "head": self._head,
+                "decoder": self._decoder.getstate(),
+                "undetected": self._undetected,
+                "messages": list(self.messages),
+                "timeline": self.timeline.copy(),
+                "scanner": scanner
+            }
 
-        return current_round
+    def restore(self, state: Dict[str, Any]) -> bool:
+        """从快照恢复解析状态, 返回是否恢复; 已经读取过内容或日志文件与快照
+        不一致时不恢复
+
+        文件必须是同一个 (设备和 inode), 开头与快照相同, 大小不小于已读取的
+        偏移; 大小没有变化时修改时间也必须相同. 之后追加的内容照常增量解析.
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                st = os.fstat(f.fileno())
+                head = f.read(len(state["head"]))
+        except OSError:
+            return False
+        offset = state["offset"]
+        if ((st.st_dev, st.st_ino) != state["identity"]
+                or head != state["head"] or st.st_size < offset
+                or (st.st_size == offset and st.st_mtime_ns != state["mtime"])):
+            return False
+        with self.lock:
+            if self.offset:
+                return False
+            # 与快照时相同的解析状态, 之前发出的游标仍然有效
+            self.generation = state["generation"]
+            self.format = state["format"]
+            self.offset = offset
+            self._identity = state["identity"]
+            self._head = state["head"]
+            self._decoder.setstate(state["decoder"])
+            self._undetected = state["undetected"]
+            self.messages = state["messages"]
+            self.timeline = state["timeline"]
+            self.scanner = state["scanner"]
+            self.scanner.classifier = self.classifier
+        return True
+
+    def _determine_message_type(self, speaker: str, message: str,
+                                role: str) -> str:
+        """判断消息类型, 规则见 classifier.DEFAULT_RULES"""
+        return self.classifier.classify(speaker, message, role)
+
+    def _apply_game_result(self, players: List[Dict],
+                           result: Optional[Tuple[int, str]]) -> int:
+        """根据游戏结果统计胜负, 返回当前轮数"""
+        if result is None:
+            return 0
+
+        is_good_guys_win = "good guys" in result[1].lower()
+        for player in players:
+            if player["role"] == "Moderator":
+                continue
+            is_good = player["role"] not in ["Werewolf"]
+            if is_good == is_good_guys_win:
+                player["win"] += 1
+            else:
+                player["loss"] += 1
+        return 1
 
     def _get_game_rounds(self) -> int:
         """获取游戏总轮数"""
@@ -274,88 +722,296 @@ class LogParser:
                 return 0
         return 0
 
-    def _replace_player_names(self, names: List[str]) -> None:
+    def _replace_player_names(self, names: List[str], players: List[Dict],
+                              dialogue: List[Dict]) -> None:
         """Replace Player1, Player2, etc. with actual names"""
-        # Create a mapping of player numbers to names
-        name_mapping = {}
-        for i, name in enumerate(names, 1):
-            name_mapping[f"Player{i}"] = name[:10]
-
-        # Update players list
-        for player in self.players:
-            if player["name"] in name_mapping:
-                player["name"] = name_mapping[player["name"]]
-                # Update avatar path if it exists
-                if "avatar" in player:
-                    player["avatar"] = player["avatar"].replace(f"Player{player['id']}", name_mapping[f"Player{player['id']}"])
-
-        # Update dialogue entries
-        for message in self.dialogue:
-            # Update speaker
-            if message["speaker"] in name_mapping:
-                message["speaker"] = name_mapping[message["speaker"]]
-            
-            # Update content - replace all occurrences of Player1, Player2, etc.
-            content = message["content"]
-            for player_num, name in name_mapping.items():
-                content = re.sub(rf'\b{player_num}\b', name, content)
-            message["content"] = content
-
-            # Update player_name if it exists
-            if "player_name" in message and message["player_name"] in name_mapping:
-                message["player_name"] = name_mapping[message["player_name"]]
-            
-            # Update living_players if it exists
-            if "living_players" in message:
-                message["living_players"] = [
-                    name_mapping.get(player, player) 
-                    for player in message["living_players"]
-                ]
-
-    def parse(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
-        """解析日志文件并返回结果"""
-        if not self.content:
+        replace_player_names(names, players, dialogue)
+
+    def parse(self,
+              names: Optional[List[str]] = None,
+              round: Optional[int] = None,
+              phase: Optional[str] = None,
+              offset: int = 0,
+              limit: Optional[int] = None) -> Dict[str, Any]:
+        """解析日志文件并返回结果, 重复调用时只解析新追加的内容
+
+        指定 ``round`` (和 ``phase``) 时只返回该轮 (阶段) 的对话, ``offset``/``limit``
+        在此范围内再取一段; ``window`` 给出返回部分在完整对话中的下标范围.
+        """
+        with self.lock:
+            self.update()
+            # 尾部未结束的记录只做临时解析, 不修改已提交的状态
+            with metrics.phase('tail'):
+                scanner = self.scanner.clone()
+                tail = scanner.finish()
+                timeline = self._timeline_with(tail)
+            total = len(self.messages) + len(tail)
+            start, end = 0, total
+            if round is not None:
+                start, end = timeline.window(round, phase, total) or (0, 0)
+            start = min(start + offset, end)
+            if limit is not None:
+                end = min(end, start + limit)
+            result = self.collect(self._slice(tail, start, end), scanner,
+                                  names, timeline, total, start)
+            result["window"] = {"start": start, "end": end, "total": total}
+            return result
+
+    def _timeline_with(self, tail: List[Message]) -> Timeline:
+        """加入尾部临时消息后的轮次索引"""
+        if not tail:
+            return self.timeline
+        timeline = self.timeline.copy()
+        timeline.feed(tail, len(self.messages))
+        return timeline
+
+    def _slice(self, tail: List[Message], start: int,
+               end: int) -> List[Message]:
+        """已提交消息加尾部消息中 [start, end) 的部分, 不复制整个列表"""
+        committed = len(self.messages)
+        return (self.messages[start:min(end, committed)] +
+                tail[max(start - committed, 0):max(end - committed, 0)])
+
+    def progress(self) -> Dict[str, Any]:
+        """轻量的解析进度, 不生成完整的对话列表"""
+        with self.lock:
+            self.update()
             return {
+                "bytes": self.offset,
+                "format": self.format,
+                "messages": len(self.messages),
+                "game_over": self.scanner.result is not None
+            }
+
+    def parse_since(self,
+                    cursor: Optional[str],
+                    names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """返回游标之后新提交的对话, 用于客户端增量追加
+
+        游标的格式为 ``"<generation>:<已提交消息数>"``, generation 是解析状态
+        每次重置时随机生成的代号. 日志被截断或轮转、解析器被释放后重建、
+        或者游标无效时 ``reset`` 为真, 返回全部对话, 客户端需要丢弃已有内容.
+        尚未结束的尾部记录放在 ``pending`` 中, 每次都会重新返回,
+        客户端应当替换而不是追加. ``players`` 只在可能变化时返回.
+        """
+        with self.lock:
+            self.update()
+            with metrics.phase('tail'):
+                scanner = self.scanner.clone()
+                tail = scanner.finish()
+                timeline = self._timeline_with(tail)
+
+            seq = self._parse_cursor(cursor)
+            reset = seq is None
+            if reset:
+                seq = 0
+            result = self.collect(self.messages[seq:] + tail, scanner, names,
+                                  timeline, len(self.messages) + len(tail),
+                                  seq)
+            committed = len(result["dialogue"]) - len(tail)
+            result["pending"] = result["dialogue"][committed:]
+            result["dialogue"] = result["dialogue"][:committed]
+            result["cursor"] = f"{self.generation}:{len(self.messages)}"
+            result["reset"] = reset
+
+            # 游戏设置和游戏结果都在游标之前时, 玩家信息没有变化
+            cursor_position = self.messages[seq - 1].position if seq else -1
+            changes = [scanner.setup_position, (scanner.result or [None])[0]]
+            if not reset and all(position is None or position <= cursor_position
+                                 for position in changes):
+                del result["players"]
+            return result
+
+    def _parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """解析游标, 返回已提交消息数; 游标无效或属于之前的解析状态时返回 None"""
+        try:
+            generation, seq = map(int, (cursor or '').split(':'))
+        except ValueError:
+            return None
+        if generation != self.generation or not 0 <= seq <= len(self.messages):
+            return None
+        return seq
+
+    def collect(self,
+                messages: List[Message],
+                scanner: Scanner,
+                names: Optional[List[str]] = None,
+                timeline: Optional[Timeline] = None,
+                total: int = 0,
+                start: int = 0) -> Dict[str, Any]:
+        """把消息事件和扫描到的游戏设置/结果汇总为返回结果
+
+        给出 ``timeline`` 时附带轮次索引 (total 为完整对话的条数, start 为
+        messages 第一条的下标, 只附带这些消息中的事件), current_round 为实际
+        进行到的轮数.
+        """
+        if not self.offset:
+            result = {
                 "players": [],
                 "dialogue": [],
                 "n_rounds": 0,
-                "current_round": 0
+                "current_round": 0,
+                "game_over": False
             }
+            if timeline is not None:
+                result["timeline"] = timeline.to_dict(0)
+            return result
 
-        # 解析游戏设置
-        self._parse_game_setup()
-
-        # 解析消息
-        self._parse_messages()
+        # 复制一份输出, 替换名字和统计胜负时不影响解析状态
+        players = [dict(player) for player in scanner.players]
+        # 添加主持人
+        players.append({
+            "id": 0,
+            "name": "Moderator",
+            "role": "Moderator"
+        })
 
         # 获取游戏轮数
         n_rounds = self._get_game_rounds()
 
         # 解析游戏结果
-        current_round = self._parse_game_result()
+        current_round = self._apply_game_result(players, scanner.result)
+        if timeline is not None:
+            current_round = timeline.round
 
-        # 按时间戳和位置排序消息
-        # self.messages.sort(key=lambda x: (x["timestamp"] or "", x["position"]))
-        self.messages.sort(key=lambda x: (x["position"]))
-
-        # 提取排序后的对话数据
-        self.dialogue = [msg["data"] for msg in self.messages]
+        # 消息事件按位置有序, 只在这里转换为输出格式的对话
+        with metrics.phase('collect'):
+            dialogue = [msg.to_dict() for msg in messages]
 
         if names:
-            self._replace_player_names(names)
+            with metrics.phase('replace_names'):
+                self._replace_player_names(names, players, dialogue)
 
-        return {
-            "players": self.players,
-            "dialogue": self.dialogue,
+        result = {
+            "players": players,
+            "dialogue": dialogue,
             "n_rounds": n_rounds,
-            "current_round": current_round
+            "current_round": current_round,
+            "game_over": scanner.result is not None
         }
+        if timeline is not None:
+            result["timeline"] = timeline.to_dict(
+                total, _name_substitution(tuple(names))[0] if names else None,
+                start, start + len(messages))
+        return result
+
+
+@lru_cache(maxsize=32)
+def _name_substitution(
+        names: Tuple[str, ...]) -> Tuple[Dict[str, str], 're.Pattern']:
+    """名字列表对应的 {PlayerN: 名字} 映射和匹配所有 PlayerN 的正则
+
+    长的编号排在前面 (Player10 先于 Player1), 一次扫描完成所有替换.
+    """
+    name_mapping = {
+        f"Player{i}": name[:10]
+        for i, name in enumerate(names, 1)
+    }
+    alternation = '|'.join(
+        sorted(name_mapping, key=lambda x: (-len(x), x)))
+    return name_mapping, re.compile(rf'\b(?:{alternation})\b')
+
+
+def replace_player_names(names: List[str], players: List[Dict],
+                         dialogue: List[Dict]) -> None:
+    """把玩家列表和对话中的 Player1, Player2, ... 替换为真实名字"""
+    name_mapping, pattern = _name_substitution(tuple(names))
+
+    def substitute(match: 're.Match') -> str:
+        return name_mapping[match.group()]
+
+    # Update players list
+    for player in players:
+        if player["name"] in name_mapping:
+            player["name"] = name_mapping[player["name"]]
+            # Update avatar path if it exists
+            if "avatar" in player:
+                player["avatar"] = pattern.sub(substitute,
+                                               player["avatar"])
+
+    # Update dialogue entries
+    for message in dialogue:
+        # 名字只替换一次, 替换后的名字中即使含有 PlayerN 也不会被再次替换
+        message["speaker"] = name_mapping.get(message["speaker"],
+                                              message["speaker"])
+        if "Player" in message["content"]:
+            message["content"] = pattern.sub(substitute,
+                                             message["content"])
+        if "player_name" in message:
+            message["player_name"] = name_mapping.get(
+                message["player_name"], message["player_name"])
+        if "living_players" in message:
+            message["living_players"] = [
+                name_mapping.get(player, player)
+                for player in message["living_players"]
+            ]
+
+
+_parsers: Dict[str, LogParser] = {}
+_parsers_lock = Lock()
+
+
+def get_parser(filename: str) -> LogParser:
+    """获取日志文件对应的持久解析器, 同一文件的多次请求共享解析状态"""
+    with _parsers_lock:
+        parser = _parsers.get(filename)
+        if parser is None:
+            parser = _parsers[filename] = LogParser(filename)
+        return parser
+
+
+def release_parser(filename: str) -> None:
+    """释放日志文件的持久解析器 (例如已经归档的游戏), 下次访问时重新创建"""
+    with _parsers_lock:
+        _parsers.pop(filename, None)
+
+
+def save_snapshot(path: str = SNAPSHOT_FILE) -> int:
+    """把所有持久解析器的状态写入快照文件, 返回写入的解析器数"""
+    with _parsers_lock:
+        parsers = list(_parsers.values())
+    states = []
+    for parser in parsers:
+        state = parser.snapshot()
+        if state is not None:
+            states.append(state)
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump({"version": SNAPSHOT_VERSION, "parsers": states}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, path)
+    return len(states)
+
+
+def load_snapshot(path: str = SNAPSHOT_FILE) -> int:
+    """从快照恢复还没有读取过的持久解析器, 返回恢复的解析器数
+
+    快照不存在、版本不同或无法读取时不恢复任何解析器.
+    """
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception:  # 快照只是缓存, 任何错误都回退到重新解析
+        return 0
+    if not isinstance(snapshot,
+                      dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return 0
+    restored = 0
+    for state in snapshot["parsers"]:
+        parser = get_parser(state["filename"])
+        if parser.restore(state):
+            restored += 1
+    return restored
 
 
 def parse_log_file(filename: str, names: Optional[List[str]] = None) -> Dict[str, Any]:
     """解析日志文件的主函数"""
     parser = LogParser(filename)
-    return parser.parse(names)
+    with metrics.phase('scan'):
+        messages = list(parser.iter_events(final=True))
+    parser.timeline.feed(messages, 0)
+    return parser.collect(messages, parser.scanner, names, parser.timeline,
+                          len(messages))
 
 
 def test_parser(filename: str, names: Optional[List[str]] = None) -> None:
@@ -0,0 +1,219 @@
+"""已结束游戏的回放: 按日志中的时间戳和倍速逐条推送对话
+
+同一局游戏 (同一个日志版本和名字列表) 只在内存中保存一份, 每条消息只序列化
+一次, 所有观众共享. 每个观众有自己的位置、倍速和暂停状态, 以及有界的发送队列:
+队列满时该观众的回放暂停推进, 慢的客户端不会让服务器内存无限增长.
+
+客户端发送的命令 (JSON)::
+
+    {"action": "pause"} / {"action": "resume"}
+    {"action": "speed", "value": 4}
+    {"action": "seek", "index": 120}
+    {"action": "seek", "round": 3, "phase": "night"}
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from archive import get_archive
+from parse import get_parser
+
+# 每个观众最多积压的消息数, 队列满时回放暂停推进
+REPLAY_QUEUE_SIZE = 32
+# 按倍速换算后两条消息之间的最长等待 (秒), 跳过 LLM 长时间思考造成的空白
+MAX_DELAY = 3.0
+DEFAULT_SPEED = 1.0
+MAX_SPEED = 100.0
+# 内存中最多保留的游戏数
+MAX_GAMES = 8
+
+
+def _seconds(timestamp: Optional[str]) -> Optional[float]:
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return None
+
+
+class ReplayGame:
+    """一局游戏的回放数据, 所有观众共享, 创建后不再修改"""
+
+    def __init__(self, game_data: Dict[str, Any],
+                 timestamps: List[Optional[str]]):
+        dialogue = game_data["dialogue"]
+        self.total = len(dialogue)
+        self.phases = game_data.get("timeline", {}).get("phases", [])
+        # 没有时间戳的消息沿用上一条的时间
+        self.times = []
+        last = None
+        for timestamp in timestamps:
+            seconds = _seconds(timestamp)
+            if seconds is not None:
+                last = seconds
+            self.times.append(last)
+        self.frames = [
+            json.dumps({"type": "message", "index": index, "message": message},
+                       ensure_ascii=False)
+            for index, message in enumerate(dialogue)
+        ]
+        self.header = {
+            "type": "replay",
+            "players": game_data["players"],
+            "timeline": game_data.get("timeline"),
+            "total": self.total
+        }
+
+    def delay(self, index: int) -> float:
+        """第 index 条消息与上一条之间的原始间隔 (秒)"""
+        if index == 0:
+            return 0.0
+        current, previous = self.times[index], self.times[index - 1]
+        if current is None or previous is None:
+            return 0.0
+        return max(0.0, current - previous)
+
+    def seek_index(self, round: int,
+                   phase: Optional[str] = None) -> Optional[int]:
+        """某一轮 (阶段) 第一条消息的下标"""
+        for item in self.phases:
+            if item["round"] == round and phase in (None, item["phase"]):
+                return item["start"]
+        return None
+
+
+class ReplaySession:
+    """一个观众的回放: 位置、倍速、暂停状态和有界的发送队列"""
+
+    def __init__(self, game: ReplayGame, speed: float = DEFAULT_SPEED,
+                 index: int = 0):
+        self.game = game
+        self.speed = speed
+        self.index = min(max(index, 0), game.total)
+        self.paused = False
+        self.queue = asyncio.Queue(maxsize=REPLAY_QUEUE_SIZE)
+        self.changed = asyncio.Event()  # 位置、倍速或暂停状态变化
+        self.generation = 0  # 每次跳转加一, 丢弃跳转前已排队的消息
+        self.immediate = True  # 开始或跳转后的第一条消息不等待
+
+    def state(self) -> str:
+        return json.dumps({
+            "type": "state",
+            "index": self.index,
+            "total": self.game.total,
+            "speed": self.speed,
+            "paused": self.paused
+        })
+
+    async def play(self) -> None:
+        """按时间戳间隔把消息放入发送队列, 队列满时等待"""
+        ended = False
+        while True:
+            if self.paused or self.index >= self.game.total:
+                if self.index >= self.game.total and not ended:
+                    await self.queue.put((self.generation,
+                                          json.dumps({"type": "end"})))
+                    ended = True
+                await self.changed.wait()
+                self.changed.clear()
+                continue
+            ended = False
+            delay = (0.0 if self.immediate else
+                     min(self.game.delay(self.index) / self.speed, MAX_DELAY))
+            try:
+                await asyncio.wait_for(self.changed.wait(), delay)
+                self.changed.clear()
+                continue  # 状态变化后重新计算等待时间
+            except asyncio.TimeoutError:
+                pass
+            generation = self.generation
+            await self.queue.put((generation,
+                                  self.game.frames[self.index]))
+            if generation == self.generation:
+                self.index += 1
+                self.immediate = False
+
+    async def next_message(self) -> str:
+        """等待下一条要发送的消息, 跳过跳转之前排队的消息"""
+        while True:
+            generation, message = await self.queue.get()
+            if generation == self.generation:
+                return message
+
+    def command(self, command: Dict[str, Any]) -> str:
+        """处理客户端命令, 返回要发送的状态消息; 命令无效时抛出 ValueError"""
+        action = command.get("action")
+        if action == "pause":
+            self.paused = True
+        elif action == "resume":
+            self.paused = False
+            self.immediate = True
+        elif action == "speed":
+            speed = float(command.get("value"))
+            if not 0 < speed <= MAX_SPEED:
+                raise ValueError("Invalid speed")
+            self.speed = speed
+        elif action == "seek":
+            if "round" in command:
+                index = self.game.seek_index(int(command["round"]),
+                                             command.get("phase"))
+                if index is None:
+                    raise ValueError("Round not found")
+            else:
+                index = int(command.get("index"))
+            self.index = min(max(index, 0), self.game.total)
+            self.generation += 1
+            self.immediate = True
+            # 丢弃跳转之前排队的消息, 让回放任务不再阻塞在满的队列上
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        else:
+            raise ValueError("Unknown action")
+        self.changed.set()
+        return self.state()
+
+
+class ReplayStore:
+    """按 (日志路径, 大小, 修改时间, 名字列表) 缓存回放数据, 所有观众共享"""
+
+    def __init__(self, max_games: int = MAX_GAMES):
+        self.max_games = max_games
+        self.games: 'OrderedDict[Tuple, ReplayGame]' = OrderedDict()
+        self.viewers = 0
+        self.lock = Lock()  # 用于线程安全
+
+    def get(self, log_file: str, names: Optional[List[str]]) -> ReplayGame:
+        """加载回放数据 (阻塞, 应在线程中调用); 已归档的游戏直接读取归档"""
+        st = os.stat(log_file)
+        key = (log_file, st.st_size, st.st_mtime_ns, tuple(names or ()))
+        with self.lock:
+            game = self.games.get(key)
+            if game is not None:
+                self.games.move_to_end(key)
+                return game
+
+        archive = get_archive()
+        game_data = archive.game_data(log_file, names)
+        if game_data is not None:
+            timestamps = archive.timestamps(log_file)
+        else:
+            parser = get_parser(log_file)
+            game_data = parser.parse(names)
+            with parser.lock:
+                timestamps = [message.timestamp
+                              for message in parser.messages]
+            timestamps += [None] * (len(game_data["dialogue"]) -
+                                    len(timestamps))
+        game = ReplayGame(game_data, timestamps[:len(game_data["dialogue"])])
+
+        with self.lock:
+            self.games[key] = game
+            self.games.move_to_end(key)
+            while len(self.games) > self.max_games:
+                self.games.popitem(last=False)
+        return game
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from groups import GroupId, resolve_group
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# 用户表和分组配置都可以通过环境变量指定, 修改文件后无需重启即可生效
+USERS_FILE = os.environ.get('ROSTER_USERS_FILE',
+                            '../metagpt/examples/werewolf_game/Users.xlsx')
+GROUPS_FILE = os.environ.get('ROSTER_GROUPS_FILE',
+                             os.path.join(ROOT, 'groups.json'))
+# 解析后的用户表缓存在仓库内的目录中, 不写入用户表所在的目录
+CACHE_DIR = os.environ.get('ROSTER_CACHE_DIR',
+                           os.path.join(ROOT, '.cache', 'roster'))
+REQUIRED_COLUMNS = ['Username', 'Description', 'Gender', 'Occupation']
+# 两次检查文件修改时间的最小间隔 (秒), 间隔内的查询直接使用内存中的索引
+CHECK_INTERVAL = 1.0
+
+
+class RosterError(ValueError):
+    """用户表格式错误"""
+
+
+class Users(NamedTuple):
+    by_name: Dict[str, Dict[str, str]]
+    usernames: List[Any]  # Username 列原样保留, 包括重复和非字符串的值
+
+
+class Groups(NamedTuple):
+    by_id: Dict[GroupId, List[str]]
+    by_user: Dict[str, List[GroupId]]  # 用户名 -> 所在的组, 按组 id 顺序
+
+
+class WatchedFile:
+    """按修改时间缓存的文件内容, 文件变化后重新加载"""
+
+    def __init__(self, path: str, load: Callable[[str, Tuple[int, int]], Any],
+                 interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.load = load
+        self.interval = interval
+        self.version = None  # (大小, 修改时间)
+        self.value = None
+        self.checked = 0.0
+        self.lock = Lock()  # 用于线程安全
+
+    def get(self) -> Any:
+        if (self.version is not None
+                and time.monotonic() - self.checked < self.interval):
+            return self.value
+        with self.lock:
+            st = os.stat(self.path)
+            version = (st.st_size, st.st_mtime_ns)
+            if version != self.version:
+                self.value = self.load(self.path, version)
+                self.version = version
+            self.checked = time.monotonic()
+            return self.value
+
+
+def _load_users(path: str, version: Tuple[int, int]) -> Users:
+    """读取用户表并按用户名建立索引
+
+    解析后的内容另存为 CACHE_DIR 中的 JSON 缓存 (按表格的绝对路径区分),
+    表格没有变化时重启也不必再解析 xlsx.
+    """
+    digest = hashlib.sha1(
+        os.path.realpath(path).encode('utf-8')).hexdigest()[:16]
+    cache_file = os.path.join(
+        CACHE_DIR, f'{os.path.basename(path)}.{digest}.json')
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached["version"] == list(version):
+            rows, usernames = cached["rows"], cached["usernames"]
+        else:
+            rows = None
+    except (OSError, ValueError, KeyError):
+        rows = None
+
+    if rows is None:
+        import pandas as pd
+
+        df = pd.read_excel(path)
+        if not all(col in df.columns for col in REQUIRED_COLUMNS):
+            raise RosterError("Missing required columns")
+        rows = df[REQUIRED_COLUMNS].fillna('').astype(str).values.tolist()
+        usernames = df['Username'].tolist()
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"version": list(version), "rows": rows,
+                           "usernames": usernames}, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    users = {}
+    for row in rows:
+        user = dict(zip(REQUIRED_COLUMNS, row))
+        users.setdefault(user['Username'], user)
+    return Users(users, usernames)
+
+
+def _load_groups(path: str, version: Tuple[int, int]) -> Groups:
+    """读取分组配置: {组 id: 按 Player1, Player2, ... 顺序排列的用户名},
+    同时建立用户名到组的索引"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    by_id = {resolve_group(key): list(names) for key, names in data.items()}
+    by_user = {}
+    for group_id, names in by_id.items():
+        for name in dict.fromkeys(names):
+            by_user.setdefault(name, []).append(group_id)
+    return Groups(by_id, by_user)
+
+
+class Roster:
+    """用户表和分组的缓存, 按用户名和组查询"""
+
+    def __init__(self,
+                 users_file: str = USERS_FILE,
+                 groups_file: str = GROUPS_FILE,
+                 interval: float = CHECK_INTERVAL):
+        self.users_file = WatchedFile(users_file, _load_users, interval)
+        self.groups_file = WatchedFile(groups_file, _load_groups, interval)
+
+    def usernames(self) -> List[Any]:
+        """用户表 Username 列的原始内容, 与直接读取表格的结果一致"""
+        return list(self.users_file.get().usernames)
+
+    def user(self, username: str) -> Optional[Dict[str, Any]]:
+        """用户信息, 包含所在的组; 不存在时返回 None"""
+        user = self.users_file.get().by_name.get(username)
+        if user is None:
+            return None
+        groups = self.groups_file.get().by_user.get(username, [])
+        return dict(user, groups=list(groups))
+
+    def groups(self) -> Dict[GroupId, List[str]]:
+        return self.groups_file.get().by_id
+
+    def group_names(self, group_id: GroupId) -> Optional[List[str]]:
+        """组内玩家的用户名, 组不存在时返回 None"""
+        return self.groups_file.get().by_id.get(resolve_group(group_id))
+
+
+_roster = None
+_roster_lock = Lock()
+
+
+def get_roster() -> Roster:
+    """进程内共享的 Roster"""
+    global _roster
+    with _roster_lock:
+        if _roster is None:
+            _roster = Roster()
+        return _roster
@@ -0,0 +1,282 @@
+"""对话全文搜索
+
+每局游戏归档时, 它的对话内容被加入归档数据库中的 FTS5 倒排索引
+(见 archive.py), 搜索只查询索引和归档, 不读取原始日志. 索引以游戏为单位
+增量更新: 只有出现 "Game over!" 并归档后的游戏可以搜索, 正在进行的游戏
+(以及没有结束就中断的游戏) 搜索不到. 结果按 BM25
+相关度排序并分页, 可以按发言者、角色、消息类型、游戏和组过滤.
+索引中是日志原文, 组日志中的玩家是 PlayerN: 查询中的真实名字 (用户名或界面
+显示的截断名字) 在该组的游戏中改写为对应的 PlayerN, 结果里再替换回真实名字.
+按发言者过滤时同样可以使用真实名字.
+
+    python search.py "vote to eliminate" [--speaker NAME] [--type Response]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from analytics import GROUP_LOG_PATTERN
+from archive import GameArchive, get_archive
+from groups import resolve_group
+from parse import _name_substitution
+from roster import get_roster
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# 查询中用双引号括起的短语或单个词, 词尾的 * 表示前缀匹配
+QUERY_TOKEN_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+SNIPPET_TOKENS = 12
+
+
+class SearchError(ValueError):
+    """查询参数错误"""
+
+
+def query_terms(text: str) -> List[Tuple[str, bool]]:
+    """用户输入中的词 (或短语), 每项为 (文本, 是否前缀匹配)"""
+    terms = []
+    for match in QUERY_TOKEN_PATTERN.finditer(text):
+        phrase, word = match.groups()
+        prefix = False
+        if word is not None:
+            prefix = word.endswith('*') and len(word) > 1
+            phrase = word.rstrip('*') if prefix else word
+        phrase = phrase.strip()
+        if phrase:
+            terms.append((phrase, prefix))
+    if not terms:
+        raise SearchError("Empty query")
+    return terms
+
+
+def _quote(phrase: str, prefix: bool = False) -> str:
+    return '"' + phrase.replace('"', '""') + '"' + ('*' if prefix else '')
+
+
+def build_query(text: str) -> str:
+    """把用户输入转换为 FTS5 查询: 所有词 (或短语) 都要出现
+
+    每个词都作为带引号的字符串传给 FTS5, 用户输入中的运算符和特殊字符
+    不会被解释.
+    """
+    return ' '.join(_quote(*term) for term in query_terms(text))
+
+
+def _players_named(name: str, names: List[str],
+                   prefix: bool = False) -> List[str]:
+    """组内用户名或显示的名字 (截断后的用户名) 为 name 的玩家 (PlayerN),
+    不区分大小写"""
+    name = name.lower()
+    mapping, _ = _name_substitution(tuple(names))
+    players = []
+    for i, username in enumerate(names, 1):
+        player = f'Player{i}'
+        for candidate in (username.lower(), mapping[player].lower()):
+            if candidate == name or (prefix and candidate.startswith(name)):
+                players.append(player)
+                break
+    return players
+
+
+def _group_pattern(group_id) -> str:
+    """匹配某组日志文件路径的 GLOB 模式"""
+    return f'*_Group{group_id}.*'
+
+
+def _group_of(log_file: str) -> Optional[str]:
+    match = GROUP_LOG_PATTERN.search(os.path.basename(log_file))
+    return match.group(1) if match else None
+
+
+class DialogueSearch:
+    """在归档的全文索引上搜索对话"""
+
+    def __init__(self, archive: Optional[GameArchive] = None):
+        self.archive = archive or get_archive()
+
+    def _speaker_filter(self, speaker: str) -> Tuple[str, List[Any]]:
+        """发言者条件: 日志中的名字 (PlayerN、Moderator) 或组内的真实名字
+        (用户名或显示的名字)"""
+        clauses = ['m.speaker = ?']
+        params = [speaker]
+        for group_id, names in get_roster().groups().items():
+            for player in _players_named(speaker, names):
+                clauses.append('(m.speaker = ? AND g.log_file GLOB ?)')
+                params += [player, _group_pattern(group_id)]
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    def _match_queries(self, query: str) -> List[Tuple[str, str, List[Any]]]:
+        """FTS5 查询及其适用的游戏, 每项为 (查询, 游戏条件, 参数)
+
+        查询中有某组玩家的真实名字时, 该组的游戏使用改写后的查询 (名字或对应的
+        PlayerN 都可以匹配), 其余游戏使用原来的查询; 各项的游戏互不重叠.
+        """
+        terms = query_terms(query)
+        queries = []
+        patterns = []
+        for group_id, names in get_roster().groups().items():
+            rewritten = []
+            renamed = False
+            for phrase, prefix in terms:
+                players = _players_named(phrase, names, prefix)
+                if players:
+                    renamed = True
+                    rewritten.append('(' + ' OR '.join(
+                        [_quote(phrase, prefix)] +
+                        [_quote(player) for player in players]) + ')')
+                else:
+                    rewritten.append(_quote(phrase, prefix))
+            if renamed:
+                pattern = _group_pattern(group_id)
+                queries.append((' '.join(rewritten), 'g.log_file GLOB ?',
+                                [pattern]))
+                patterns.append(pattern)
+        if patterns:
+            others = 'NOT (' + ' OR '.join(['g.log_file GLOB ?'] *
+                                           len(patterns)) + ')'
+        else:
+            others = ''
+        queries.append((build_query(query), others, patterns))
+        return queries
+
+    def search(self,
+               query: str,
+               speaker: Optional[str] = None,
+               role: Optional[str] = None,
+               type: Optional[str] = None,
+               game: Optional[int] = None,
+               group: Optional[str] = None,
+               page: int = 1,
+               per_page: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+        """按相关度返回第 page 页的结果和结果总数"""
+        if page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+            raise SearchError("Invalid page or per_page")
+        if not self.archive.has_fts():
+            raise SearchError("Full-text search is not available")
+
+        where = []
+        params: List[Any] = []
+        if speaker:
+            clause, values = self._speaker_filter(speaker)
+            where.append(clause)
+            params += values
+        for column, value in (("m.role", role), ("m.type", type),
+                              ("m.game_id", game)):
+            if value is not None and value != '':
+                where.append(f'{column} = ?')
+                params.append(value)
+        if group:
+            where.append('g.log_file GLOB ?')
+            params.append(_group_pattern(resolve_group(group)))
+        # CROSS JOIN 固定连接顺序: 先查倒排索引, 再按主键取消息和游戏,
+        # 避免查询规划器改用 type/speaker 索引逐行匹配全文条件
+        tables = ('messages_fts CROSS JOIN messages m '
+                  'ON m.id = messages_fts.rowid '
+                  'CROSS JOIN games g ON g.id = m.game_id')
+        # 每个 FTS5 查询一个 SELECT, 它们的游戏互不重叠, 用 UNION ALL 合并
+        selects = []
+        select_params: List[Any] = []
+        for match, games, games_params in self._match_queries(query):
+            condition = ' AND '.join(['messages_fts MATCH ?'] +
+                                     ([games] if games else []) + where)
+            selects.append(f'FROM {tables} WHERE {condition}')
+            select_params += [match] + games_params + params
+
+        total = self.archive.execute(
+            'SELECT COUNT(*) FROM (' + ' UNION ALL '.join(
+                f'SELECT m.id {select}' for select in selects) + ')',
+            select_params).fetchone()[0]
+        rows = self.archive.execute(
+            ' UNION ALL '.join(
+                f'SELECT m.game_id, g.log_file, m.seq, m.round, m.phase, '
+                f'm.speaker, m.role, m.type, m.content, '
+                f"snippet(messages_fts, 0, '<mark>', '</mark>', '…', "
+                f'{SNIPPET_TOKENS}) AS snippet, '
+                f'bm25(messages_fts) AS score {select}'
+                for select in selects) + ' ORDER BY score LIMIT ? OFFSET ?',
+            select_params + [per_page, (page - 1) * per_page]).fetchall()
+
+        groups = get_roster().groups()
+        results = []
+        for row in rows:
+            group_id = _group_of(row["log_file"])
+            names = (groups.get(resolve_group(group_id))
+                     if group_id is not None else None)
+            result = {
+                "game_id": row["game_id"],
+                "log_file": row["log_file"],
+                "group": group_id,
+                "index": row["seq"],
+                "round": row["round"],
+                "phase": row["phase"],
+                "speaker": row["speaker"],
+                "role": row["role"],
+                "type": row["type"],
+                "content": row["content"],
+                "snippet": row["snippet"],
+                "score": -row["score"]  # bm25 越小越相关, 取反后越大越相关
+            }
+            if names:
+                mapping, pattern = _name_substitution(tuple(names))
+                result["speaker"] = mapping.get(row["speaker"],
+                                                row["speaker"])
+                for key in ("content", "snippet"):
+                    result[key] = pattern.sub(
+                        lambda match: mapping[match.group()], result[key])
+            results.append(result)
+        return {
+            "query": query,
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "results": results
+        }
+
+
+_search = None
+_search_lock = Lock()
+
+
+def get_search() -> DialogueSearch:
+    """进程内共享的搜索"""
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = DialogueSearch()
+        return _search
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('query')
+    parser.add_argument('--speaker')
+    parser.add_argument('--role')
+    parser.add_argument('--type')
+    parser.add_argument('--game', type=int)
+    parser.add_argument('--group')
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--per-page', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+
+    result = get_search().search(args.query, args.speaker, args.role,
+                                 args.type, args.game, args.group, args.page,
+                                 args.per_page)
+    if args.json:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return 0
+    print(f"{result['total']} results")
+    for item in result["results"]:
+        print(f"[{item['score']:.2f}] game {item['game_id']} "
+              f"round {item['round']} {item['phase']} #{item['index']} "
+              f"{item['speaker']} ({item['type']}): {item['snippet']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
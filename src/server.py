@@ -1,10 +1,155 @@
-# 使用 FastAPI 创建 WebSocket 服务器
-from fastapi import FastAPI, WebSocket
+# 使用 FastAPI 提供 HTTP API、WebSocket 和 SSE
+from fastapi import (FastAPI, HTTPException, Query, Request, WebSocket,
+                     WebSocketDisconnect)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import (JSONResponse, PlainTextResponse, Response,
+                               StreamingResponse)
 import json
 import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
 
-app = FastAPI()
+# 解析等模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics import Leaderboard  # noqa: E402
+from archive import get_archive  # noqa: E402
+from cache import CachedResponse, ResponseCache  # noqa: E402
+from game_manager import GameManager  # noqa: E402
+from groups import group_log_file, resolve_group  # noqa: E402
+from live import LiveHub  # noqa: E402
+from parse import (get_parser, load_snapshot, release_parser,  # noqa: E402
+                   save_snapshot)
+from replay import (DEFAULT_SPEED, MAX_SPEED, ReplaySession,  # noqa: E402
+                    ReplayStore)
+from roster import RosterError, get_roster  # noqa: E402
+from search import SearchError, get_search  # noqa: E402
+from timeline import PHASES  # noqa: E402
+from wire import compact_game_data, compress, negotiate_encoding  # noqa: E402
+import metrics  # noqa: E402
+
+
+class GameState:
+
+    def __init__(self):
+        self.n_rounds = 10  # 默认值
+        self.n_players = 5  # 默认值
+        self.log_file = ''
+        self.lock = Lock()  # 用于线程安全
+
+    def set(self, n_round, n_players, log_file):
+        with self.lock:
+            self.n_rounds = n_round
+            self.n_players = n_players
+            self.log_file = log_file
+
+    def get(self):
+        with self.lock:
+            return self.n_rounds, self.n_players, self.log_file
+
+
+class InFlight:
+    """合并相同的并发请求: 同一个 key 同时只在线程池中计算一次, 其余请求等待同一个结果"""
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self.executor = executor
+        self.pending: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, func: Callable, *args) -> Any:
+        if metrics.profiling():
+            # 记录性能的请求单独计算, 不等待别的请求的结果, 记录中才有计算过程
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, metrics.profiled(func), *args)
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args)
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None)
+                                     if self.pending.get(key) is future
+                                     else None)
+        # 某个客户端断开时不取消其他请求也在等待的计算
+        return await asyncio.shield(future)
+
+# 启动时在后台恢复解析快照、预先解析各组日志并填充响应缓存, WARM_UP=0 关闭
+WARM_UP = os.environ.get('WARM_UP', '1') != '0'
+# 浏览器默认的 Accept-Encoding, 预热时按它压缩响应
+BROWSER_ACCEPT_ENCODING = 'gzip, deflate, br'
+DEFAULT_WINDOW = (None, None, 0, None)
+
+# 启动各阶段的耗时 (秒): ready 从进程启动到可以接受请求, warmup 是后台预热,
+# first_request 从进程启动到第一个请求完成, first_request_latency 是它的处理时间
+startup: Dict[str, float] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup["ready"] = time.time() - metrics.PROCESS_START_TIME
+    print(f"Ready in {startup['ready']:.2f}s")
+    if WARM_UP:
+        Thread(target=_warm_up,
+               args=(asyncio.get_running_loop(), ),
+               name='warm-up',
+               daemon=True).start()
+    yield
+    # 保存解析状态, 下次启动时不必重新解析正在进行的游戏
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, save_snapshot)
+    except Exception as e:
+        print(f"Failed to save parse snapshot: {e}")
+
+
+app = FastAPI(lifespan=lifespan)
+
+# 每个日志文件只有一个轮询解析器, 新对话推送给所有连接的客户端
+hub = LiveHub()
+
+# 创建全局游戏状态实例
+game_state = GameState()
+
+# 并发运行多局游戏, 超过上限的排队
+game_manager = GameManager(log_dir='./logs',
+                           max_running=int(
+                               os.environ.get('MAX_CONCURRENT_GAMES', 2)))
+
+# 解析日志等耗 CPU 的工作在有界线程池中进行, 不阻塞事件循环;
+# 解析器保存增量状态, 因此使用线程而不是进程
+executor = ThreadPoolExecutor(max_workers=int(
+    os.environ.get('PARSE_WORKERS', 4)),
+                              thread_name_prefix='parse')
+in_flight = InFlight(executor)
+
+# 已序列化 (并压缩) 的 /api/game-data 响应,
+# 按 (日志路径, 大小, 修改时间, 名字列表, 游标, 窗口, 格式, 压缩方式) 缓存
+game_data_cache = ResponseCache(max_entries=64, max_bytes=64 << 20)
+metrics.register_cache('game_data', game_data_cache)
+
+# 跨组排行榜, 只重新解析有变化的日志
+leaderboard = Leaderboard(log_dir='./logs')
+
+# 回放数据按游戏共享, 每个观众只保存自己的播放状态
+replay_store = ReplayStore()
+
+LIVE_MESSAGES = metrics.REGISTRY.register(
+    metrics.Counter('werewolf_live_messages_total', '推送给客户端的消息数',
+                    ('transport', )))
+metrics.REGISTRY.register(
+    metrics.Gauge('werewolf_live_subscribers', '正在观看的客户端数',
+                  ('log_file', ), lambda: {
+                      (log_file, ): len(watcher.subscribers)
+                      for log_file, watcher in list(hub.watchers.items())
+                  }))
+metrics.REGISTRY.register(
+    metrics.Gauge('werewolf_startup_seconds', '启动各阶段的耗时', ('stage', ),
+                  lambda: {(stage, ): seconds
+                           for stage, seconds in list(startup.items())}))
+metrics.REGISTRY.register(
+    metrics.Gauge('werewolf_replay_viewers', '正在观看回放的客户端数', (),
+                  lambda: {(): replay_store.viewers}))
 
 # 配置 CORS
 app.add_middleware(
@@ -13,25 +158,488 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Profile-File"],
 )
 
-# WebSocket 连接处理
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    profiler = metrics.start_profile(request.headers)
+    try:
+        response = await call_next(request)
+    finally:
+        # 路由匹配后 scope 中才有 route
+        route = request.scope.get("route")
+        route = route.path if route is not None else "unmatched"
+        profile_file = metrics.finish_profile(profiler, route)
+    if profile_file:
+        response.headers["X-Profile-File"] = profile_file
+    size = response.headers.get("content-length")
+    duration = time.perf_counter() - start
+    metrics.observe_request("fastapi", request.method, route,
+                            response.status_code, duration,
+                            int(size) if size is not None else None)
+    # 抓取 /metrics 不算第一个请求
+    if "first_request" not in startup and route != "/metrics":
+        startup["first_request_latency"] = duration
+        startup["first_request"] = time.time() - metrics.PROCESS_START_TIME
+        print(f"First request {request.url.path} took {duration * 1000:.1f}ms,"
+              f" {startup['first_request']:.2f}s after start")
+    return response
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(),
+                             media_type=metrics.CONTENT_TYPE)
+
+
+def _run(func: Callable, *args) -> asyncio.Future:
+    """在有界线程池中运行阻塞的函数"""
+    return asyncio.get_running_loop().run_in_executor(executor,
+                                                      metrics.profiled(func),
+                                                      *args)
+
+
+async def _request_data(request: Request) -> Dict[str, Any]:
+    """依次尝试 JSON、表单和 URL 参数"""
+    data = None
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("application/json"):
+            data = await request.json()
+        elif content_type.startswith(("application/x-www-form-urlencoded",
+                                      "multipart/form-data")):
+            data = dict(await request.form())
+    except (ValueError, AssertionError):
+        data = None
+    if not data:
+        data = dict(request.query_params)
+    return data or {}
+
+
+@app.api_route("/api/user-data", methods=["GET", "POST"])
+async def upload_user_data(request: Request):
+    try:
+        # 处理 GET 请求
+        if request.method == "GET":
+            # 用户表只在文件变化后重新读取
+            try:
+                usernames = await _run(get_roster().usernames)
+            except RosterError as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+
+            return {
+                'code': 200,
+                'message': 'GET request received',
+                'usernames': usernames
+            }
+
+        # 处理 POST 请求
+        content_type = request.headers.get("content-type", "")
+        try:
+            if content_type.startswith("application/json"):
+                data = await request.json()
+            else:
+                data = dict(await request.form())  # 尝试获取表单数据
+        except (ValueError, AssertionError):
+            data = None
+
+        if not data:
+            return JSONResponse({"error": "No data provided"}, status_code=400)
+
+        return {
+            'code': 200,
+            'message': 'User data uploaded successfully',
+        }
+
+    except Exception as e:
+        return JSONResponse(
+            {"error": f"Failed to upload user data: {str(e)}"},
+            status_code=500)
+
+
+@app.api_route("/api/init-game", methods=["GET", "POST"])
+async def init_game(request: Request):
+    try:
+        data = await _request_data(request)
+        n_round = data.get('n_round', 2)
+        n_player = data.get('n_player', 5)
+
+        # 游戏在后台子进程中运行, 输出写入每局游戏自己的日志文件
+        game = await _run(game_manager.submit, int(n_round), int(n_player))
+        game_state.set(n_round, n_player, game.log_file)
+
+        return {
+            'code': 200,
+            'message': "success",
+            'n_round': n_round,
+            'n_player': n_player,
+            'game_id': game.id,
+            'status': game.status
+        }
+
+    except Exception as e:
+        return JSONResponse(
+            {
+                "code": 500,
+                "error": str(e),
+                "message": "Internal server error"
+            },
+            status_code=500)
+
+
+@app.get("/api/games")
+async def list_games():
+    games = await _run(
+        lambda: [game_manager.status(game) for game in game_manager.list()])
+    return {'code': 200, 'games': games}
+
+
+@app.get("/api/games/{game_id}")
+async def get_game(game_id: str):
+    game = game_manager.get(game_id)
+    if game is None:
+        return JSONResponse({"code": 404, "error": "Game not found"},
+                            status_code=404)
+    status = await in_flight.run(('status', game_id), game_manager.status,
+                                 game)
+    return dict(status, code=200)
+
+
+@app.get("/api/leaderboard")
+async def get_leaderboard():
+    try:
+        result = await in_flight.run('leaderboard', leaderboard.result)
+        return dict(result, code=200)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/api/search")
+async def search_dialogue(q: str = "",
+                          speaker: Optional[str] = None,
+                          role: Optional[str] = None,
+                          type: Optional[str] = None,
+                          game: Optional[int] = None,
+                          group: Optional[str] = None,
+                          page: int = 1,
+                          per_page: int = 20):
+    # 只查询归档中的全文索引, 不读取原始日志; 游戏结束并归档后才能搜索到,
+    # 正在进行的游戏不在索引中
+    try:
+        result = await _run(get_search().search, q, speaker, role, type, game,
+                            group, page, per_page)
+        return dict(result, code=200)
+    except SearchError as e:
+        return JSONResponse({"code": 400, "error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def _build_game_data(key: Hashable, log_file: str, player_names,
+                     cursor: Optional[str], window: Tuple,
+                     wire_format: str,
+                     encoding: Optional[str]) -> CachedResponse:
+    """解析日志, 序列化并压缩 (在线程池中运行)
+
+    window 为 (round, phase, offset, limit), 见 LogParser.parse.
+    """
+    # 请求处理函数已经查找过缓存并计入了未命中, 这里只检查等待期间是否已经生成
+    entry = game_data_cache.peek(key)
+    if entry is None:
+        # 已结束的游戏直接查询归档
+        game_data = None
+        if cursor is None:
+            game_data = get_archive().game_data(log_file, player_names,
+                                                *window)
+        if game_data is None:
+            # 每个日志文件复用同一个解析器, 轮询时只解析新追加的内容
+            parser = get_parser(log_file)
+            if cursor is None:
+                game_data = parser.parse(player_names, *window)
+            else:
+                game_data = parser.parse_since(cursor, player_names)
+            if game_data["game_over"]:
+                executor.submit(_archive_game, log_file)
+        with metrics.phase('serialize'):
+            if wire_format == 'compact':
+                game_data = compact_game_data(game_data)
+            body = json.dumps(game_data, ensure_ascii=False,
+                              separators=(',', ':')
+                              if wire_format == 'compact' else None)
+            body, encoding = compress(body.encode('utf-8'), encoding)
+        entry = game_data_cache.put(key, body, encoding)
+    return entry
+
+
+def _game_data_key(log_file: str, player_names, cursor: Optional[str],
+                   window: Tuple, wire_format: str,
+                   encoding: Optional[str]) -> Tuple:
+    """响应缓存的键, 包含日志文件当前的大小和修改时间, 文件变化后自然失效"""
+    try:
+        st = os.stat(log_file)
+        file_version = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        file_version = None
+    return (log_file, file_version, tuple(player_names), cursor, window,
+            wire_format, encoding)
+
+
+def _warm_up(loop: asyncio.AbstractEventLoop) -> None:
+    """恢复解析快照, 预先生成各组 /api/game-data 的默认响应并刷新排行榜
+
+    在后台线程中运行, 不推迟服务器开始接受请求. 响应通过 in_flight 生成,
+    预热期间到达的相同请求等待预热的结果, 不会重复解析和序列化; 小的日志
+    先预热, 尽快让更多的组可以直接命中缓存.
+    """
+    start = time.perf_counter()
+    restored = load_snapshot()
+    encodings = {None, negotiate_encoding(BROWSER_ACCEPT_ENCODING)}
+    primed = 0
+    try:
+        groups = get_roster().groups()
+    except Exception as e:
+        print(f"Failed to load groups: {e}")
+        groups = {}
+    logs = []
+    for group_id, names in groups.items():
+        log_file = group_log_file(group_id)
+        if os.path.exists(log_file):
+            logs.append((os.path.getsize(log_file), log_file, names))
+    for _, log_file, names in sorted(logs, key=lambda item: item[0]):
+        try:
+            for encoding in encodings:
+                key = _game_data_key(log_file, names, None, DEFAULT_WINDOW,
+                                     'json', encoding)
+                asyncio.run_coroutine_threadsafe(
+                    in_flight.run(key, _build_game_data, key, log_file,
+                                  names, None, DEFAULT_WINDOW, 'json',
+                                  encoding), loop).result()
+            primed += 1
+        except Exception as e:
+            print(f"Failed to warm up {log_file}: {e}")
+    try:
+        leaderboard.refresh()
+    except Exception as e:
+        print(f"Failed to refresh leaderboard: {e}")
+    startup["warmup"] = time.perf_counter() - start
+    print(f"Warm-up: restored {restored} parsers, primed {primed} logs "
+          f"in {startup['warmup']:.2f}s")
+    try:
+        save_snapshot()
+    except Exception as e:
+        print(f"Failed to save parse snapshot: {e}")
+
+
+def _archive_game(log_file: str) -> None:
+    """归档已结束的游戏, 之后不再需要保留它的解析状态"""
+    try:
+        if get_archive().archive(log_file):
+            release_parser(log_file)
+    except Exception as e:
+        print(f"Failed to archive {log_file}: {e}")
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 中是否包含当前的 ETag (弱比较)"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/').strip('"') == etag:
+            return True
+    return False
+
+
+@app.get("/api/game-data")
+async def get_game_data(request: Request,
+                        group: Optional[str] = None,
+                        game_id: Optional[str] = None,
+                        cursor: Optional[str] = None,
+                        round: Optional[int] = None,
+                        phase: Optional[str] = None,
+                        offset: int = 0,
+                        limit: Optional[int] = None,
+                        wire_format: str = Query("json", alias="format")):
+    try:
+        # 指定 game_id 时查看由 /api/init-game 启动的游戏, 与组无关
+        if game_id is not None:
+            game = game_manager.get(game_id)
+            if game is None:
+                return JSONResponse({"error": "Game not found"},
+                                    status_code=404)
+            log_file, player_names = game.log_file, []
+        else:
+            n_round, n_player, log_file = game_state.get()
+            # 默认查看 /api/init-game 选择的组, group 参数可以直接指定组
+            group_id = resolve_group(group if group is not None else n_round)
+            log_file = group_log_file(group_id)
+            player_names = get_roster().group_names(group_id)
+            if player_names is None:
+                return JSONResponse({"error": "Group not found"},
+                                    status_code=404)
+        # 带 cursor 参数时只返回游标之后新增的对话 (首次请求传空的 cursor)
+        # format=compact 时使用紧凑格式 (见 wire.py)
+        if wire_format not in ("json", "compact"):
+            return JSONResponse({"error": "Unknown format"}, status_code=400)
+        # round (和 phase) 只返回某一轮 (阶段) 的对话, offset/limit 在其中再取一段
+        window = (round, phase, offset, limit)
+        if phase is not None and (round is None or phase not in PHASES):
+            return JSONResponse({"error": "Invalid phase"}, status_code=400)
+        if offset < 0 or (limit is not None and limit < 0):
+            return JSONResponse({"error": "Invalid offset or limit"},
+                                status_code=400)
+        if cursor is not None and window != (None, None, 0, None):
+            return JSONResponse(
+                {"error": "cursor cannot be combined with round/phase/"
+                 "offset/limit"},
+                status_code=400)
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+        # 日志文件没有变化时直接返回缓存的响应
+        key = _game_data_key(log_file, player_names, cursor, window,
+                             wire_format, encoding)
+        entry = game_data_cache.get(key)
+        if entry is None:
+            # 相同的并发请求只解析一次
+            entry = await in_flight.run(key, _build_game_data, key, log_file,
+                                        player_names, cursor, window,
+                                        wire_format, encoding)
+
+        # 要求浏览器每次都带 If-None-Match 重新验证
+        headers = {
+            "ETag": f'"{entry.etag}"',
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding"
+        }
+        if entry.encoding is not None:
+            headers["Content-Encoding"] = entry.encoding
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body,
+                        media_type="application/json",
+                        headers=headers)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# WebSocket 连接处理: 先发送完整快照, 之后推送新增的对话
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    group_id = resolve_group(websocket.query_params.get("group", 1))
+    names = get_roster().group_names(group_id)
+    if names is None:
+        await websocket.close(code=1008)
+        return
+
+    subscriber = hub.subscribe(group_log_file(group_id), names)
     try:
         while True:
-            # 这里替换为你的程序输
-            dialogue_message = {
-                "playerId": 1,
-                "content": "这是一条新消息",
-                "time": "Day 1"
-            }
-            await websocket.send_json(dialogue_message)
-            await asyncio.sleep(2)  # 每2秒发送一条消息
+            await websocket.send_text(await subscriber.next_message())
+            LIVE_MESSAGES.inc(("websocket", ))
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print(f"Error: {e}")
         await websocket.close()
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+# 回放已结束的游戏: 按时间戳和倍速推送对话, 客户端可以暂停、调速和跳转
+@app.websocket("/ws/replay")
+async def replay_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    params = websocket.query_params
+    if "game_id" in params:
+        game = game_manager.get(params["game_id"])
+        if game is None:
+            await websocket.close(code=1008)
+            return
+        log_file, names = game.log_file, []
+    else:
+        group_id = resolve_group(params.get("group", 1))
+        names = get_roster().group_names(group_id)
+        if names is None:
+            await websocket.close(code=1008)
+            return
+        log_file = group_log_file(group_id)
+    try:
+        speed = float(params.get("speed", DEFAULT_SPEED))
+        if not 0 < speed <= MAX_SPEED:
+            raise ValueError("Invalid speed")
+        # 同一局游戏同时打开多个回放时只加载一次
+        game = await in_flight.run(('replay', log_file, tuple(names)),
+                                   replay_store.get, log_file, names)
+        session = ReplaySession(game, speed)
+        if "round" in params:
+            session.command({"action": "seek", "round": params["round"],
+                             "phase": params.get("phase")})
+    except (ValueError, OSError):
+        await websocket.close(code=1008)
+        return
+
+    send_lock = asyncio.Lock()  # 消息和命令的回复来自两个任务
+
+    async def send(text: str) -> None:
+        async with send_lock:
+            await websocket.send_text(text)
+
+    async def send_messages():
+        while True:
+            await send(await session.next_message())
+            LIVE_MESSAGES.inc(("replay", ))
+
+    async def receive_commands():
+        while True:
+            text = await websocket.receive_text()
+            try:
+                reply = session.command(json.loads(text))
+            except (ValueError, TypeError, AttributeError) as e:
+                reply = json.dumps({"type": "error", "error": str(e)})
+            await send(reply)
+
+    replay_store.viewers += 1
+    await send(json.dumps(dict(game.header, speed=session.speed),
+                          ensure_ascii=False))
+    tasks = [asyncio.create_task(coro) for coro in
+             (session.play(), send_messages(), receive_commands())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        replay_store.viewers -= 1
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception():
+                exception = task.exception()
+                if not isinstance(exception, WebSocketDisconnect):
+                    print(f"Error: {exception}")
+
+
+# 不支持 WebSocket 的客户端可以使用 Server-Sent Events
+@app.get("/api/events")
+async def game_events(group: str = "1"):
+    group_id = resolve_group(group)
+    names = get_roster().group_names(group_id)
+    if names is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    log_file = group_log_file(group_id)
+
+    async def stream():
+        # 在生成器中订阅: 客户端在响应开始前断开时不会留下订阅者
+        subscriber = hub.subscribe(log_file, names)
+        try:
+            while True:
+                yield f"data: {await subscriber.next_message()}\n\n"
+                LIVE_MESSAGES.inc(("sse", ))
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
 
 # 或者使用 HTTP API
 @app.get("/api/dialogue")
@@ -52,7 +660,7 @@ async def get_dialogue():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
 
 
     
\ No newline at end of file
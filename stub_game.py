@@ -0,0 +1,69 @@
+"""代替 MetaGPT start_game.py 的本地游戏进程, 用于在没有 LLM 的环境中测试
+
+参数与 start_game.py 相同, 把 bench.generate_log 生成的日志写到标准输出.
+随机种子取自环境变量 WEREWOLF_SEED (与 tournament.py 传给游戏的相同),
+``--rate`` 按每秒行数逐步写出日志, 模拟正在进行的游戏 (0 表示一次写完),
+``--fail-rate`` 按概率在游戏中途以非零状态退出, 用于测试重试.
+
+    python stub_game.py 20 9 50 [--rate 20] [--fail-rate 0.2]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from bench import generate_log
+
+# 按速率写出时每次写入和刷新的间隔 (秒)
+TICK = 0.1
+
+
+def write_lines(text: str, rate: float) -> None:
+    """按每秒 rate 行写到标准输出, rate 为 0 时一次写完"""
+    if rate <= 0:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+    lines = text.splitlines(keepends=True)
+    start = time.monotonic()
+    written = 0
+    while written < len(lines):
+        # 按开始以来的时间计算应写出的行数, 不累积 sleep 的误差
+        due = min(len(lines), int((time.monotonic() - start) * rate) + 1)
+        if due > written:
+            sys.stdout.write(''.join(lines[written:due]))
+            sys.stdout.flush()
+            written = due
+        time.sleep(TICK)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('n_round', type=int)
+    parser.add_argument('n_player', type=int)
+    parser.add_argument('extra', nargs='*')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='每秒写出的行数, 0 表示一次写完')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='中途失败退出的概率')
+    args = parser.parse_args()
+
+    seed = int(os.environ.get('WEREWOLF_SEED', random.randrange(2**31)))
+    # start_game.py 的 n_round 是发言轮数, 大约四轮为一个昼夜
+    content = generate_log(players=args.n_player,
+                           rounds=max(1, args.n_round // 4),
+                           seed=seed)
+    # 同一种子的重试不一定再次失败
+    attempt = int(os.environ.get('WEREWOLF_ATTEMPT', 1))
+    if random.Random(f'{seed}-{attempt}').random() < args.fail_rate:
+        write_lines(content[:len(content) // 2], args.rate)
+        print('Traceback (most recent call last):\n'
+              'RuntimeError: stub game failed', file=sys.stderr)
+        return 1
+    write_lines(content, args.rate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
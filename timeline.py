@@ -0,0 +1,136 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from message import Message
+
+# 主持人宣布天黑 (新一轮开始) 和天亮
+NIGHT_PATTERN = re.compile(r'It[’\']s dark', re.IGNORECASE)
+DAY_PATTERN = re.compile(r'daylight|daytime', re.IGNORECASE)
+# "Player4 was killed last night" / "Player2 and Player5 were killed"
+KILL_PATTERN = re.compile(
+    r'((?:Player\d+(?:,\s*|\s+and\s+)?)+)\s+(?:was|were)\s+killed')
+ELIMINATION_PATTERN = re.compile(
+    r'((?:Player\d+(?:,\s*|\s+and\s+)?)+)\s+(?:was|were)\s+eliminated')
+VOTE_PATTERN = re.compile(r'vote to eliminate (Player\d+)')
+PLAYER_PATTERN = re.compile(r'Player\d+')
+PHASES = ('setup', 'night', 'day')
+
+
+class Timeline:
+    """对话的轮次索引: 昼夜分界、击杀、放逐、投票和死亡, 记录每项在对话中的下标
+
+    第一次天黑之前的对话属于第 0 轮的 setup 阶段, 之后每次天黑开始新的一轮.
+    投票只统计 RESPONSE 消息 (与 analytics 一致, 同一票的发言行不重复计数).
+    """
+
+    def __init__(self):
+        self.round = 0
+        self.phase = 'setup'
+        # [{"round", "phase", "start", "deaths"}], 结束位置是下一阶段的开始
+        self.phases = [{"round": 0, "phase": 'setup', "start": 0, "deaths": []}]
+        self.events = []
+        self.game_over = None  # 游戏结束消息的下标
+
+    def copy(self) -> 'Timeline':
+        """复制索引, 用于临时加入尾部消息"""
+        timeline = Timeline()
+        timeline.__dict__.update(self.__dict__)
+        timeline.phases = [dict(phase, deaths=list(phase["deaths"]))
+                           for phase in self.phases]
+        timeline.events = list(self.events)
+        return timeline
+
+    def feed(self, messages: List[Message], start: int) -> None:
+        """加入新提交的消息事件, start 是第一条消息在对话中的下标"""
+        for index, message in enumerate(messages, start):
+            content = message.content
+            if message.speaker == "Moderator":
+                self._moderator(index, content)
+            elif message.type == "Response" and "vote to eliminate" in content:
+                match = VOTE_PATTERN.search(content)
+                if match:
+                    self._event("vote", index, player=message.speaker,
+                                target=match.group(1))
+
+    def _moderator(self, index: int, content: str) -> None:
+        if content.startswith("Game over!"):
+            if self.game_over is None:
+                self.game_over = index
+                self._event("game_over", index)
+            return
+        if NIGHT_PATTERN.search(content):
+            self._start_phase(self.round + 1, 'night', index)
+        elif DAY_PATTERN.search(content) and self.phase != 'day':
+            self._start_phase(max(self.round, 1), 'day', index)
+        for kind, pattern in (("kill", KILL_PATTERN),
+                              ("elimination", ELIMINATION_PATTERN)):
+            match = pattern.search(content)
+            if match:
+                for player in PLAYER_PATTERN.findall(match.group(1)):
+                    self._event(kind, index, player=player)
+                    self.phases[-1]["deaths"].append(player)
+
+    def _start_phase(self, round: int, phase: str, index: int) -> None:
+        self.round, self.phase = round, phase
+        if self.phases[-1]["start"] == index:
+            self.phases.pop()  # 上一阶段没有任何对话
+        self.phases.append({
+            "round": round,
+            "phase": phase,
+            "start": index,
+            "deaths": []
+        })
+
+    def _event(self, kind: str, index: int, **fields) -> None:
+        self.events.append(
+            dict(type=kind, round=self.round, phase=self.phase, index=index,
+                 **fields))
+
+    def window(self, round: int, phase: Optional[str],
+               total: int) -> Optional[Tuple[int, int]]:
+        """某一轮 (或某一轮的某个阶段) 在对话中的下标范围 [start, end), 不存在时返回 None"""
+        start = end = None
+        for i, item in enumerate(self.phases):
+            if item["round"] == round and phase in (None, item["phase"]):
+                if start is None:
+                    start = item["start"]
+                end = (self.phases[i + 1]["start"]
+                       if i + 1 < len(self.phases) else total)
+        if start is None:
+            return None
+        return start, end
+
+    def to_dict(self,
+                total: int,
+                name_mapping: Optional[Dict[str, str]] = None,
+                start: int = 0,
+                end: Optional[int] = None) -> Dict[str, Any]:
+        """输出格式的索引, total 是对话总数, name_mapping 把 PlayerN 换成名字
+
+        阶段列表总是完整的, 便于客户端跳转; 事件只包含下标在 [start, end) 内的.
+        """
+        if end is None:
+            end = total
+        rename = ((lambda name: name_mapping.get(name, name))
+                  if name_mapping else (lambda name: name))
+        phases = []
+        for i, item in enumerate(self.phases):
+            phase_end = (self.phases[i + 1]["start"]
+                         if i + 1 < len(self.phases) else total)
+            phases.append(dict(item, end=phase_end,
+                               deaths=[rename(p) for p in item["deaths"]]))
+        events = []
+        for event in self.events:
+            if not start <= event["index"] < end:
+                continue
+            event = dict(event)
+            for key in ("player", "target"):
+                if key in event:
+                    event[key] = rename(event[key])
+            events.append(event)
+        return {
+            "rounds": self.round,
+            "phases": phases,
+            "events": events,
+            "game_over": self.game_over
+        }
@@ -0,0 +1,300 @@
+"""并行运行一批游戏 (代替 werewolf_start.sh)
+
+每局游戏是一个独立的子进程, 有自己的日志文件和随机种子 (环境变量
+WEREWOLF_SEED, 同时设置 PYTHONHASHSEED), 同时运行的游戏数默认等于 CPU 数.
+失败 (非零退出、超时或日志中没有游戏结束) 的游戏会重试, 失败的日志改名为
+``<日志>.attemptN`` 保留. 每局结束后立即在进程池中解析日志并写入归档,
+整批结束时结果已经可以查询. 结果清单在每局结束后更新, 写在日志目录下的
+``tournament_<编号>.json``.
+
+    python tournament.py --games 20 [--rounds 20] [--players 9] [--workers 8]
+    python tournament.py --games 4 --script stub_game.py --script-arg=--fail-rate=0.3
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Event, Lock
+from typing import Any, Dict, List, Optional
+
+from archive import GameArchive, get_archive, read_game
+from game_manager import START_GAME_SCRIPT, game_command
+
+DEFAULT_RETRIES = 2
+# 重试前的等待 (秒)
+RETRY_DELAY = 1.0
+
+
+class TournamentGame:
+    """一批游戏中的一局"""
+
+    def __init__(self, index: int, seed: int, log_file: str):
+        self.index = index
+        self.seed = seed
+        self.log_file = log_file
+        self.status = 'queued'  # queued / running / finished / failed / cancelled
+        self.attempts = 0
+        self.returncode = None
+        self.error = None
+        self.failed_logs: List[str] = []
+        self.started_at = None
+        self.finished_at = None
+        self.archive_id = None
+        self.result = None
+        self.rounds = None
+        self.messages = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "seed": self.seed,
+            "log_file": self.log_file,
+            "status": self.status,
+            "attempts": self.attempts,
+            "returncode": self.returncode,
+            "error": self.error,
+            "failed_logs": self.failed_logs,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": (self.finished_at - self.started_at
+                         if self.started_at and self.finished_at else None),
+            "archive_id": self.archive_id,
+            "result": self.result,
+            "rounds": self.rounds,
+            "messages": self.messages
+        }
+
+
+class Tournament:
+    """在线程池中运行游戏子进程, 在进程池中解析结束的日志"""
+
+    def __init__(self,
+                 games: int,
+                 n_round: int = 20,
+                 n_player: int = 9,
+                 log_dir: str = './logs',
+                 workers: Optional[int] = None,
+                 retries: int = DEFAULT_RETRIES,
+                 timeout: Optional[float] = None,
+                 seed: int = 0,
+                 script: str = START_GAME_SCRIPT,
+                 script_args: Optional[List[str]] = None,
+                 archive: Optional[GameArchive] = None):
+        self.id = time.strftime('%Y%m%d-%H%M%S')
+        self.n_round = n_round
+        self.n_player = n_player
+        self.log_dir = log_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.retries = retries
+        self.timeout = timeout
+        self.seed = seed
+        self.command = (game_command(script, n_round, n_player) +
+                        list(script_args or []))
+        self.archive = archive or get_archive()
+        self.manifest_file = os.path.join(log_dir,
+                                          f'tournament_{self.id}.json')
+        self.games = [
+            TournamentGame(
+                i, seed + i,
+                os.path.join(log_dir, f'output_{n_round}_{n_player}_'
+                             f't{self.id}-{i:03d}.log'))
+            for i in range(games)
+        ]
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.stopping = Event()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = Lock()  # 用于线程安全
+
+    def run(self) -> Dict[str, Any]:
+        """运行所有游戏, 返回结果清单; Ctrl-C 时结束正在运行的游戏"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.started_at = time.time()
+        self._write_manifest()
+        with ProcessPoolExecutor(min(self.workers, len(self.games)) or 1) as parsers, \
+                ThreadPoolExecutor(self.workers) as runners:
+            futures = [runners.submit(self._play, game, parsers)
+                       for game in self.games]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                self.stop()
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                self.finished_at = time.time()
+                self._write_manifest()
+        return self.manifest()
+
+    def stop(self) -> None:
+        """不再启动新的游戏, 结束正在运行的游戏"""
+        self.stopping.set()
+        with self.lock:
+            processes = list(self.processes.values())
+            for game in self.games:
+                if game.status == 'queued':
+                    game.status = 'cancelled'
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    def _play(self, game: TournamentGame,
+              parsers: ProcessPoolExecutor) -> None:
+        """运行一局游戏直到成功或用完重试次数, 然后解析和归档"""
+        while not self.stopping.is_set():
+            with self.lock:
+                game.attempts += 1
+                game.status = 'running'
+                game.error = None
+                if game.started_at is None:
+                    game.started_at = time.time()
+            game.returncode, game.error = self._attempt(game)
+            record = None
+            if game.returncode == 0:
+                try:
+                    record = parsers.submit(read_game, game.log_file).result()
+                except Exception as e:  # 解析失败同样按失败重试
+                    game.error = f'parse failed: {e}'
+                else:
+                    if record is None:
+                        game.error = 'game did not finish'
+            if record is not None:
+                self._store(game, record)
+                break
+            if self.stopping.is_set() or game.attempts > self.retries:
+                with self.lock:
+                    game.status = ('cancelled' if self.stopping.is_set() else
+                                   'failed')
+                    game.finished_at = time.time()
+                break
+            # 保留失败的日志用于排查, 下一次尝试写入原来的文件名
+            failed_log = f'{game.log_file}.attempt{game.attempts}'
+            if os.path.exists(game.log_file):
+                os.replace(game.log_file, failed_log)
+                game.failed_logs.append(failed_log)
+            self.stopping.wait(RETRY_DELAY)
+        self._write_manifest()
+
+    def _attempt(self, game: TournamentGame):
+        """运行一次游戏子进程, 返回 (退出码, 错误信息)"""
+        env = dict(os.environ,
+                   WEREWOLF_SEED=str(game.seed),
+                   WEREWOLF_ATTEMPT=str(game.attempts),
+                   PYTHONHASHSEED=str(game.seed))
+        try:
+            with open(game.log_file, 'wb') as log:
+                process = subprocess.Popen(self.command,
+                                           stdout=log,
+                                           stderr=subprocess.STDOUT,
+                                           stdin=subprocess.DEVNULL,
+                                           env=env)
+        except OSError as e:
+            return None, str(e)
+        with self.lock:
+            self.processes[game.index] = process
+        try:
+            returncode = process.wait(self.timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return None, f'timed out after {self.timeout}s'
+        finally:
+            with self.lock:
+                self.processes.pop(game.index, None)
+        if returncode != 0:
+            return returncode, f'exited with {returncode}'
+        return returncode, None
+
+    def _store(self, game: TournamentGame, record: Dict[str, Any]) -> None:
+        """把解析结果写入归档并记录到清单"""
+        try:
+            self.archive.store(record)
+            row = self.archive.execute('SELECT id FROM games WHERE log_file = ?',
+                                       (record["log_file"], )).fetchone()
+            archive_id = row["id"] if row else None
+        except Exception as e:  # 归档失败不影响游戏结果
+            archive_id = None
+            game.error = f'archive failed: {e}'
+        with self.lock:
+            game.status = 'finished'
+            game.finished_at = time.time()
+            game.archive_id = archive_id
+            game.result = record["result"]
+            game.rounds = record["rounds"]
+            game.messages = len(record["messages"])
+
+    def manifest(self) -> Dict[str, Any]:
+        with self.lock:
+            games = [game.to_dict() for game in self.games]
+        counts = {}
+        for game in games:
+            counts[game["status"]] = counts.get(game["status"], 0) + 1
+        return {
+            "tournament": self.id,
+            "command": self.command,
+            "n_round": self.n_round,
+            "n_player": self.n_player,
+            "seed": self.seed,
+            "workers": self.workers,
+            "retries": self.retries,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "counts": counts,
+            "games": games
+        }
+
+    def _write_manifest(self) -> None:
+        """原子地写入结果清单, 中途中断时清单也是完整的 JSON"""
+        manifest = self.manifest()
+        with self.lock:
+            tmp_file = f'{self.manifest_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.manifest_file)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, required=True, help='游戏局数')
+    parser.add_argument('--rounds', type=int, default=20,
+                        help='传给游戏脚本的 n_round')
+    parser.add_argument('--players', type=int, default=9)
+    parser.add_argument('--workers', type=int,
+                        help='同时运行的游戏数, 默认等于 CPU 数')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help='每局失败后的最多重试次数')
+    parser.add_argument('--timeout', type=float, help='每次尝试的最长时间 (秒)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='第一局的种子, 之后每局加一')
+    parser.add_argument('--log-dir', default='./logs')
+    parser.add_argument('--script', default=START_GAME_SCRIPT,
+                        help='游戏脚本, 本地测试可以使用 stub_game.py')
+    parser.add_argument('--script-arg', action='append', default=[],
+                        help='追加到游戏脚本命令行的参数, 可以重复')
+    args = parser.parse_args()
+
+    tournament = Tournament(args.games, args.rounds, args.players,
+                            args.log_dir, args.workers, args.retries,
+                            args.timeout, args.seed, args.script,
+                            args.script_arg)
+    try:
+        manifest = tournament.run()
+    except KeyboardInterrupt:
+        print(f'Interrupted, manifest: {tournament.manifest_file}')
+        return 130
+    counts = ', '.join(f'{count} {status}'
+                       for status, count in sorted(manifest["counts"].items()))
+    print(f'{len(manifest["games"])} games in '
+          f'{manifest["finished_at"] - manifest["started_at"]:.1f}s '
+          f'({counts}), manifest: {tournament.manifest_file}')
+    return 0 if manifest["counts"].get('finished') == len(manifest["games"]) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""/api/game-data 的紧凑格式和压缩
+
+紧凑格式 (``format=compact``) 把发言者、角色和消息类型放进表里, 对话中只引用
+下标; 每条 THOUGHT/RESPONSE 都带的 living_players 只在有玩家死亡、名单变化时
+记录一个新的快照. 每条对话是一个数组::
+
+    [发言者, 角色, 类型, 内容]
+    [发言者, 角色, 类型, 内容, player_name, living 快照]   # JSON 块中的消息
+
+player_name 为空时为 -1.
+"""
+import gzip
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖
+    brotli = None
+
+# 小于该大小的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+
+
+class _Table:
+    """值到下标的映射, 按首次出现的顺序编号"""
+
+    def __init__(self):
+        self.index: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def add(self, value: Any) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+def _encode_dialogue(dialogue: List[Dict], names: _Table, roles: _Table,
+                     types: _Table, snapshots: List[List[int]],
+                     last: List[Optional[Tuple[str, ...]]]) -> List[List]:
+    rows = []
+    for message in dialogue:
+        row = [
+            names.add(message["speaker"]),
+            roles.add(message["role"]),
+            types.add(message["type"]), message["content"]
+        ]
+        if "living_players" in message:
+            living = tuple(message["living_players"])
+            if living != last[0]:
+                snapshots.append([names.add(name) for name in living])
+                last[0] = living
+            player_name = message.get("player_name")
+            row.append(names.add(player_name) if player_name else -1)
+            row.append(len(snapshots) - 1)
+        rows.append(row)
+    return rows
+
+
+def compact_game_data(game_data: Dict[str, Any]) -> Dict[str, Any]:
+    """把 parse()/parse_since() 的结果转换为紧凑格式"""
+    names, roles, types = _Table(), _Table(), _Table()
+    snapshots = []
+    last = [None]  # 上一个 living_players 快照
+    result = {
+        key: value
+        for key, value in game_data.items()
+        if key not in ("dialogue", "pending")
+    }
+    result["format"] = "compact"
+    result["dialogue"] = _encode_dialogue(game_data["dialogue"], names, roles,
+                                          types, snapshots, last)
+    if "pending" in game_data:
+        result["pending"] = _encode_dialogue(game_data["pending"], names,
+                                             roles, types, snapshots, last)
+    result["names"] = names.values
+    result["roles"] = roles.values
+    result["types"] = types.values
+    result["living"] = snapshots
+    return result
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据 Accept-Encoding 选择 'br'、'gzip' 或不压缩 (None)"""
+    if not accept_encoding:
+        return None
+    supported = {"gzip": 1}
+    if brotli is not None:
+        supported["br"] = 2  # q 相同时优先 brotli
+    best, best_key = None, (0, 0)
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0
+        if coding in supported and q > 0 and (q, supported[coding]) > best_key:
+            best, best_key = coding, (q, supported[coding])
+    return best
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """压缩响应内容, 返回 (内容, 实际使用的编码)"""
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6, mtime=0), "gzip"